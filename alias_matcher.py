@@ -0,0 +1,99 @@
+"""
+Compiled multi-pattern alias matcher (Aho-Corasick).
+
+Finds every alias that occurs as a substring of a value in one pass over the
+value, no matter how many aliases are loaded, so the port table can grow to the
+full UN/LOCODE list without slowing the POL cleaning down.
+
+Priority rule for overlapping hits: every alias carries a priority (lower wins).
+`from_mapping` gives each alias the position of its entry in the mapping, which is
+the same "first entry in the table wins" behaviour the alias loop always had, but
+now explicit: e.g. "ZJG" is listed under both ZHENJIANG and ZHANGJIAGANG and
+resolves to ZHENJIANG because that entry comes first. Hits with the same priority
+are broken by the leftmost, then longest, alias.
+"""
+from collections import deque
+
+
+class AliasMatcher:
+    def __init__(self):
+        self._goto = [{}]      # node -> {char: next node}
+        self._fail = [0]       # node -> longest proper suffix node
+        self._out = [[]]       # node -> [(priority, alias, target)] ending at this node
+        self._built = False
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """ Build from {target: [alias, ...]}, priority = position of the target in the mapping """
+        matcher = cls()
+        for priority, (target, aliases) in enumerate(mapping.items()):
+            for alias in aliases:
+                matcher.add(alias, target, priority)
+        return matcher.build()
+
+    def add(self, alias, target, priority=0):
+        if not alias:
+            return self
+        node = 0
+        for ch in alias:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((priority, alias, target))
+        self._built = False
+        return self
+
+    def build(self):
+        """ Compute failure links breadth-first and merge suffix outputs into each node """
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+        self._built = True
+        return self
+
+    def find_all(self, text):
+        """ Every alias hit in `text` as (start, priority, alias, target), in the order they end """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for priority, alias, target in out[node]:
+                hits.append((i - len(alias) + 1, priority, alias, target))
+        return hits
+
+    def best(self, text):
+        """ Target of the winning hit (lowest priority, then leftmost, then longest alias), or None """
+        hits = self.find_all(text)
+        if not hits:
+            return None
+        _, _, _, target = min(hits, key=lambda hit: (hit[1], hit[0], -len(hit[2])))
+        return target
+
+    def ambiguous_aliases(self):
+        """ {alias: [targets]} for aliases that are listed under more than one target """
+        targets = {}
+        for entries in self._out:
+            for _, alias, target in entries:
+                targets.setdefault(alias, [])
+                if target not in targets[alias]:
+                    targets[alias].append(target)
+        return {alias: found for alias, found in targets.items() if len(found) > 1}
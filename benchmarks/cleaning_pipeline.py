@@ -0,0 +1,278 @@
+"""
+Stage by stage benchmark of the cleaning pipeline on synthetic agent workbooks.
+
+    python benchmarks/cleaning_pipeline.py --workbooks 5 --rows 2000
+    python benchmarks/cleaning_pipeline.py --save-baseline     # store this run as the baseline
+    python benchmarks/cleaning_pipeline.py                     # compare against it, exit 1 on a regression
+
+The workbooks are as messy as the agents' own: title rows above a header that moves from file
+to file, ports as aliases, codes and odd spellings, carriers as SCAC codes, dates as text in
+several formats, Excel serials and real dates, NIL / - markers, rates with currency and
+thousands separators, and two remark columns. Every stage runs on every workbook; the
+time is the best of --repeat plain runs and the peak memory comes from one more run under
+tracemalloc, which would slow the timed runs down. The upload stage writes to a throwaway SQLiteStorage.
+The baseline holds rows/s and peak memory per stage and is only comparable on the same
+machine with the same --workbooks / --rows / --seed.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from functools import partial
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ratesheet_cleaning import (  # noqa: E402
+    port_aliases, carrier_aliases, city_mapping_keywords,
+    detect_header_row, read_rate_sheet, standardize_columns, resolve_pol_column, resolve_carrier_column,
+    resolve_city_column, standardize_date_columns, coerce_rate_columns, write_cleaned_frame, load_upload_frame,
+    use_normalization_cache,
+)
+from rate_storage import SQLiteStorage  # noqa: E402
+
+# stages faster than this in total are timer noise, they are never flagged as slower
+NOISE_FLOOR_SECONDS = 0.01
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cleaning_pipeline_baseline.json")
+
+TITLE_ROWS = [["ABC LOGISTICS CO., LTD"], ["OCEAN FREIGHT RATES - TRANSPACIFIC EASTBOUND"],
+              ["VALID FOR SHIPMENTS FROM 2025"], [], ["ALL RATES IN USD, SUBJECT TO CHANGE"]]
+HEADER = ["POL", "DESTINATION", "CARRIER", "T/T", "20GP", "40GP", "40HQ", "45HQ", "EFFECTIVE DATE",
+          "EXPIRY DATE", "COMM", "Rate remarks", "Remarks"]
+TRANSIT_TIMES = ["14", "18", "21", "25-28", "30", "NIL"]
+COMMODITIES = ["FAK", "GARMENT", "FURNITURE", "NIL", None]
+REMARKS = ["SUBJECT TO GRI", "NOT INCLUDE PSS", "VIA SINGAPORE", "DG +200", "-", None]
+
+
+PORTS = list(port_aliases.items())
+CITY_KEYWORDS = [keywords.split(", ") for keywords in city_mapping_keywords.values()]
+CARRIERS = list(carrier_aliases.items())
+
+
+def _pol(rng):
+    canonical, aliases = rng.choice(PORTS)
+    alias = rng.choice(aliases)  # lowercase name or port code
+    return rng.choice([canonical, canonical.title(), alias, alias.upper(), f" {alias} ", f"{alias.title()}, China"])
+
+
+def _destination(rng):
+    keyword = rng.choice(rng.choice(CITY_KEYWORDS))
+    return rng.choice([keyword, keyword.title(), f"{keyword} CY", f"{keyword.lower()} ramp"])
+
+
+def _carrier(rng):
+    canonical, aliases = rng.choice(CARRIERS)
+    return rng.choice([canonical, canonical.lower(), *aliases])  # aliases are mostly SCAC codes
+
+
+def _rate(rng, amount):
+    kind = rng.random()
+    if kind < 0.70:
+        return amount
+    if kind < 0.85:
+        return f"USD {amount:,}"
+    if kind < 0.92:
+        return str(amount)
+    return rng.choice(["NIL", "-", "AT COST", f"{amount}+BAF"])
+
+
+def _date(rng, day):
+    kind = rng.random()
+    if kind < 0.25:
+        return (day - datetime(1899, 12, 30)).days  # Excel serial
+    if kind < 0.45:
+        return day  # stored as a date by Excel
+    if kind < 0.95:
+        return day.strftime(rng.choice(["%m/%d/%Y", "%Y-%m-%d", "%d-%b-%Y", "%Y.%m.%d", "%Y/%m/%d"]))
+    return rng.choice(["NIL", "-"])
+
+
+def synthetic_rows(rows, rng):
+    """ Data rows of one agent workbook, in HEADER order """
+    start = datetime(2025, 7, 1)
+    body = []
+    for _ in range(rows):
+        gp20 = rng.randrange(800, 4000, 25)
+        effective = start + timedelta(days=rng.randrange(0, 60))
+        body.append([
+            _pol(rng), _destination(rng), _carrier(rng), rng.choice(TRANSIT_TIMES),
+            _rate(rng, gp20), _rate(rng, int(gp20 * 1.25)), _rate(rng, int(gp20 * 1.3)), _rate(rng, int(gp20 * 1.6)),
+            _date(rng, effective), _date(rng, effective + timedelta(days=30)),
+            rng.choice(COMMODITIES), rng.choice(REMARKS), rng.choice(REMARKS),
+        ])
+    return body
+
+
+def write_synthetic_workbook(path, rows, seed=0):
+    """ One messy agent workbook with `rows` rate rows; the header sits 0 - 5 rows down """
+    rng = random.Random(seed)
+    sheet = TITLE_ROWS[:rng.randrange(0, len(TITLE_ROWS) + 1)] + [HEADER] + synthetic_rows(rows, rng)
+    pd.DataFrame(sheet).to_excel(path, header=False, index=False)
+    return path
+
+
+# ---------------------------
+# Stages
+# ---------------------------
+
+def _read(path, _):
+    return read_rate_sheet(path)[0]
+
+
+def _column_stage(col, resolve_column):
+    def run(path, df):
+        df = df.copy()
+        df[col] = resolve_column(df[col])
+        return df
+    return run
+
+
+def _dates(path, df):
+    return standardize_date_columns(df.copy(), path)
+
+
+def _rates(path, df):
+    return coerce_rate_columns(df.copy(), path)[0]
+
+
+def _write(path, df):
+    output = os.path.splitext(path)[0] + ".parquet"
+    write_cleaned_frame(df, output)
+    return output
+
+
+def _upload(storage, path, parquet):
+    table = os.path.splitext(os.path.basename(path))[0]
+    result = storage.write_tables({table: partial(load_upload_frame, parquet)}, max_workers=1)[table]
+    if not result["ok"]:
+        raise RuntimeError(result["error"])
+    return parquet
+
+
+# stage name -> (fn(path, input) -> output, name of the stage whose output it takes, None for the workbook)
+def pipeline_stages(storage):
+    return {
+        "read_excel": (lambda path, _: pd.read_excel(path, header=None, dtype=object), None),
+        "detect_header_row": (lambda path, raw: detect_header_row(raw), "read_excel"),
+        "read_rate_sheet": (_read, None),
+        "standardize_columns": (lambda path, df: standardize_columns(df.copy()), "read_rate_sheet"),
+        "fuzzy_match_pol": (_column_stage("POL", resolve_pol_column), "standardize_columns"),
+        "standardize_date_columns": (_dates, "fuzzy_match_pol"),
+        "fuzzy_match_carrier": (_column_stage("Carrier", resolve_carrier_column), "standardize_date_columns"),
+        "fuzzy_match_city": (_column_stage("Destination", resolve_city_column), "fuzzy_match_carrier"),
+        "coerce_rate_columns": (_rates, "fuzzy_match_city"),
+        "write_cleaned_frame": (_write, "coerce_rate_columns"),
+        "upload": (partial(_upload, storage), "write_cleaned_frame"),
+    }
+
+
+def _run(fn, path, data):
+    with contextlib.redirect_stdout(io.StringIO()):  # the cleaning chain prints every step
+        return fn(path, data)
+
+
+def measure(fn, path, data, repeat=1):
+    """ (output, best of `repeat` seconds, peak bytes) of one stage on one workbook """
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = _run(fn, path, data)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    _run(fn, path, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, seconds, peak
+
+
+def run_benchmark(workbooks, rows, seed, directory, repeat=1):
+    use_normalization_cache(None)  # every value goes through the matchers, as on a cold cache
+    storage = SQLiteStorage(os.path.join(directory, "rates.sqlite"))
+    stages = pipeline_stages(storage)
+    totals = {name: {"seconds": 0.0, "peak": 0} for name in stages}
+
+    for i in range(workbooks):
+        path = write_synthetic_workbook(os.path.join(directory, f"agent_{i:03d}_2025.xlsx"), rows, seed + i)
+        outputs = {}
+        for name, (fn, source) in stages.items():
+            outputs[name], seconds, peak = measure(fn, path, outputs.get(source), repeat)
+            totals[name]["seconds"] += seconds
+            totals[name]["peak"] = max(totals[name]["peak"], peak)
+
+    return {name: {"seconds": round(t["seconds"], 4),
+                   "rows_per_second": round(workbooks * rows / t["seconds"], 1) if t["seconds"] else None,
+                   "peak_mib": round(t["peak"] / 2**20, 2)} for name, t in totals.items()}
+
+
+def compare(results, baseline, tolerance):
+    """ Print every stage against the baseline, returns the stages that got slower or bigger beyond `tolerance` """
+    regressions = []
+    print(f"{'stage':<26} {'rows/s':>12} {'baseline':>12} {'peak MiB':>10} {'baseline':>10}")
+    for name, result in results.items():
+        before = baseline.get(name, {})
+        flags = []
+        if (before.get("rows_per_second") and result["seconds"] >= NOISE_FLOOR_SECONDS
+                and result["rows_per_second"] < before["rows_per_second"] * (1 - tolerance)):
+            flags.append("slower")
+        if before.get("peak_mib") and result["peak_mib"] > before["peak_mib"] * (1 + tolerance):
+            flags.append("more memory")
+        if flags:
+            regressions.append(name)
+        print(f"{name:<26} {result['rows_per_second'] or 0:>12,.0f} {before.get('rows_per_second') or 0:>12,.0f} "
+              f"{result['peak_mib']:>10.2f} {before.get('peak_mib') or 0:>10.2f}"
+              + (f"  ❌ {', '.join(flags)}" if flags else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workbooks", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=2000, help="rate rows per workbook")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="time every stage this many times and keep the best")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON file of a previous run to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="fraction by which rows/s may drop or peak memory grow before it counts as a regression")
+    parser.add_argument("--keep", metavar="DIR", help="write the workbooks here and keep them, instead of a temp dir")
+    args = parser.parse_args()
+
+    config = {"workbooks": args.workbooks, "rows": args.rows, "seed": args.seed}
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        results = run_benchmark(args.workbooks, args.rows, args.seed, args.keep, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmark(args.workbooks, args.rows, args.seed, directory, args.repeat)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "stages": results}, f, indent=2)
+        print(f"✅ baseline saved: {args.baseline}")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("config") == config:
+            baseline = stored["stages"]
+        else:
+            print(f"⚠️ baseline was run with {stored.get('config')}, not comparable with {config}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory and build time of the app's route index, object frames vs route_engine.build_route_index().
+
+    python benchmarks/route_index_memory.py --rows 1000000 --tables 50
+
+The synthetic tables look like what BigQuery hands the app: object columns throughout, rates
+as text for some agents, a small port / carrier vocabulary and a handful of remarks.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from route_engine import ROUTE_KEYS, build_route_index, match_routes  # noqa: E402
+
+POLS = ["SHANGHAI", "NINGBO, ZHEJIANG", "SHENZHEN, GUANGDONG", "XIAMEN, FUJIAN", "QINGDAO", "BUSAN, KOREA",
+        "HAIPHONG, VIETNAM", "HOCHIMINH CITY, VIETNAM", "LAEM CHABANG, THAILAND", "PORT KLANG, MALAYSIA"]
+DESTINATIONS = ["LAX/LGB", "OAKLAND, CA", "SEATTLE, WA", "NEW YORK, NY", "SAVANNAH, GA", "HOUSTON, TX",
+                "CHICAGO, IL", "DALLAS, TX", "ATLANTA, GA", "MEMPHIS, TN", "DENVER, CO", "MIAMI, FL"]
+CARRIERS = ["MSC", "ONE", "COSCO", "OOCL", "EMC", "YML", "HMM", "CMA", "ZIM", "WANHAI"]
+REMARKS = [None, "FAK", "SUBJECT TO GRI", "NOT INCLUDE PSS", "VIA SINGAPORE", "DG +200"]
+
+
+def synthetic_tables(rows, tables, seed=0):
+    rng = np.random.default_rng(seed)
+    per_table = rows // tables
+    frames = {}
+    for t in range(tables):
+        gp20 = rng.integers(800, 4000, per_table).astype(float)
+        frames[f"cleaned_agent_{t:03d}"] = pd.DataFrame({
+            "POL": rng.choice(np.array([f" {p.lower()}" for p in POLS] + POLS, dtype=object), per_table),
+            "Destination": rng.choice(np.array(DESTINATIONS, dtype=object), per_table),
+            "Carrier": rng.choice(np.array(CARRIERS, dtype=object), per_table),
+            "GP20": gp20.astype(str).astype(object) if t % 3 == 0 else gp20,
+            "GP40": gp20 * 1.25,
+            "T_T_TO_POD": rng.choice(np.array(["14", "18", "21", "25-28"], dtype=object), per_table),
+            "Expiring_Date": pd.Timestamp("2025-07-31"),
+            "remark": rng.choice(np.array(REMARKS, dtype=object), per_table),
+            "COMM": rng.choice(np.array([None, "FAK", "GARMENT"], dtype=object), per_table),
+        })
+    return frames
+
+
+def object_route_index(tables):
+    """ The index as the app built it before: a normalized copy of every table, object columns """
+    frames = []
+    for table, df in tables.items():
+        df = df.copy()
+        for col in ROUTE_KEYS:
+            df[col] = df[col].astype(str).str.strip().str.upper()
+        df["Source table"] = table
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def measure(name, build, tables, routes):
+    start = time.perf_counter()
+    index = build(tables)
+    build_seconds = time.perf_counter() - start
+
+    # second build under tracemalloc for the peak, tracing slows the build down
+    del index
+    tracemalloc.start()
+    index = build(tables)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    matched = match_routes(index, routes)[0] if "Row id" in index.columns else index.merge(
+        pd.DataFrame(routes, columns=ROUTE_KEYS), on=ROUTE_KEYS)
+    match_seconds = time.perf_counter() - start
+
+    footprint = index.memory_usage(deep=True).sum()
+    print(f"{name:<12} {len(index):>10,} rows  {footprint / 2**20:>9.1f} MiB held  "
+          f"{peak / 2**20:>9.1f} MiB peak  build {build_seconds:6.2f}s  match {match_seconds * 1000:8.1f} ms "
+          f"({len(matched):,} rows)")
+    return footprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tables", type=int, default=50)
+    args = parser.parse_args()
+
+    tables = synthetic_tables(args.rows, args.tables)
+    routes = [(p, d, c) for p in POLS[:5] for d in DESTINATIONS[:5] for c in CARRIERS[:4]]
+    before = measure("object", object_route_index, tables, routes)
+    after = measure("categorical", build_route_index, tables, routes)
+    print(f"per-session index footprint: {before / after:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
+import re
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from google.api_core import exceptions as api_exceptions
 from google.cloud import bigquery
 
 def get_bigquery_client():
@@ -6,4 +13,226 @@ def get_bigquery_client():
 def get_cleaned_tables(dataset_name: str, prefix: str = "cleaned_"):
     client = get_bigquery_client()
     tables = client.list_tables(dataset_name)
-    return [table.table_id for table in tables if table.table_id.startswith(prefix)]
\ No newline at end of file
+    return [table.table_id for table in tables if table.table_id.startswith(prefix)]
+
+# ---------------------------
+# Concurrent Loads
+# ---------------------------
+
+TRANSIENT_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    ConnectionError,
+    TimeoutError,
+)
+TRANSIENT_REASONS = {"backendError", "internalError", "rateLimitExceeded"}
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    # BigQuery reports rate limits as 403s, the job error reason tells them apart from real permission errors
+    reasons = {err.get("reason") for err in getattr(exc, "errors", None) or [] if isinstance(err, dict)}
+    return bool(reasons & TRANSIENT_REASONS)
+
+def upload_dataframes(client, frames: dict, max_workers: int = 8, retries: int = 3, backoff: float = 2.0,
+                      poll_interval: float = 1.0, job_config=None):
+    """
+    Load {table_id: DataFrame or zero-argument callable returning one} into BigQuery with at most
+    `max_workers` load jobs in flight. Jobs are submitted from a thread pool, polled together, and
+    transient failures are retried up to `retries` times with exponential backoff.
+    `client` only needs load_table_from_dataframe(), so a local fake client works for tests.
+    Returns {table_id: {"ok", "seconds", "attempts", "error"}} in the order of `frames`.
+    """
+    if job_config is None:
+        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+
+    def submit(table_id):
+        frame = frames[table_id]
+        df = frame() if callable(frame) else frame
+        return client.load_table_from_dataframe(df, table_id, job_config=job_config)
+
+    results = {table_id: {"ok": False, "seconds": None, "attempts": 0, "error": None} for table_id in frames}
+    started = {}
+    waiting = [(0.0, table_id) for table_id in frames]  # (not before, table_id)
+    submitting = {}                                    # table_id -> future returning the load job
+    running = {}                                       # table_id -> load job
+
+    def finish(table_id, error=None):
+        results[table_id].update(ok=error is None, seconds=round(time.monotonic() - started[table_id], 3),
+                                 error=None if error is None else f"{type(error).__name__}: {error}")
+
+    def failed(table_id, exc):
+        if _is_transient(exc) and results[table_id]["attempts"] <= retries:
+            delay = backoff * 2 ** (results[table_id]["attempts"] - 1)
+            print(f"🔁 {table_id}: {type(exc).__name__}, retrying in {delay:.1f}s")
+            waiting.append((time.monotonic() + delay, table_id))
+        else:
+            finish(table_id, exc)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while waiting or submitting or running:
+            now = time.monotonic()
+
+            # keep at most max_workers jobs in flight
+            for item in sorted(waiting):
+                if len(submitting) + len(running) >= max_workers or item[0] > now:
+                    break
+                waiting.remove(item)
+                table_id = item[1]
+                started.setdefault(table_id, now)
+                results[table_id]["attempts"] += 1
+                submitting[table_id] = pool.submit(submit, table_id)
+
+            for table_id, future in list(submitting.items()):
+                if future.done():
+                    del submitting[table_id]
+                    try:
+                        running[table_id] = future.result()
+                    except Exception as exc:
+                        failed(table_id, exc)
+
+            for table_id, job in list(running.items()):
+                if job.done():
+                    del running[table_id]
+                    try:
+                        job.result()
+                        finish(table_id)
+                    except Exception as exc:
+                        failed(table_id, exc)
+
+            if waiting or submitting or running:
+                time.sleep(poll_interval)
+    return results
+
+# ---------------------------
+# Versioned Tables
+# ---------------------------
+# Uploads never overwrite the tables readers are using: each run loads into new physical
+# tables (<table>__v<version>) and then swaps the one-table pointer below in a single load
+# job, so readers see either the whole previous rate set or the whole new one. Physical
+# tables replaced by a promote are marked retired with the version that retired them, and
+# dropped by a later run once no reader can still hold the old pointer.
+
+POINTER_TABLE = "_rate_table_versions"
+# how long the app keeps a pointer before reading it again (streamlit_app.get_table_versions)
+POINTER_TTL_SECONDS = 300
+# retired tables are kept for the pointer TTL plus the time a query started just before it runs
+RETIRED_GRACE_SECONDS = 2 * POINTER_TTL_SECONDS
+VERSION_FORMAT = "%Y%m%dT%H%M%S"  # UTC
+
+def versioned_table_name(table_name: str, version: str) -> str:
+    return f"{table_name}__v{version}"
+
+def split_retired(retired: dict, now=None):
+    """ ([physical tables safe to drop], {physical: retired version} still in their grace period) """
+    now = now or datetime.now(timezone.utc)
+    drop, keep = [], {}
+    for physical, version in retired.items():
+        try:
+            retired_at = datetime.strptime(version, VERSION_FORMAT).replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            retired_at = None  # no usable version, keep it one more grace period
+        if retired_at is not None and (now - retired_at).total_seconds() > RETIRED_GRACE_SECONDS:
+            drop.append(physical)
+        else:
+            keep[physical] = version if retired_at is not None else now.strftime(VERSION_FORMAT)
+    return drop, keep
+
+def read_table_versions(client, dataset_ref: str):
+    """
+    {"active": {logical table: physical table}, "retired": {physical table: version that retired it}},
+    None before the first promote
+    """
+    query = f"SELECT logical_table, physical_table, status, version FROM `{dataset_ref}.{POINTER_TABLE}`"
+    try:
+        rows = client.query(query).result()
+    except api_exceptions.NotFound:
+        return None
+    versions = {"active": {}, "retired": {}}
+    for row in rows:
+        if row["status"] == "active":
+            versions["active"][row["logical_table"]] = row["physical_table"]
+        else:
+            versions["retired"][row["physical_table"]] = row["version"]
+    return versions
+
+def pointer_rows(active: dict, retired, version: str):
+    """ Pointer table rows; `retired` is {physical: retired version} or a list of tables retired by `version` """
+    retired = retired if isinstance(retired, dict) else dict.fromkeys(retired, version)
+    rows = [(logical, physical, "active", version) for logical, physical in sorted(active.items())]
+    rows += [(None, physical, "retired", retired_version) for physical, retired_version in sorted(retired.items())]
+    return rows
+
+def promote_table_versions(client, dataset_ref: str, active: dict, retired, version: str):
+    """ Point readers at `active` in one atomic WRITE_TRUNCATE of the pointer table """
+    rows = pointer_rows(active, retired, version)
+    df = pd.DataFrame(rows, columns=["logical_table", "physical_table", "status", "version"])
+    job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    client.load_table_from_dataframe(df, f"{dataset_ref}.{POINTER_TABLE}", job_config=job_config).result()
+
+# ---------------------------
+# Consolidated Rates Table
+# ---------------------------
+# One fact table over the whole rate set, so a route lookup is a single query that BigQuery
+# prunes by Expiring_Date partition and POL / Destination / Carrier clustering, instead of a
+# SELECT * per agent table. It is versioned and promoted together with the per-file tables.
+
+CONSOLIDATED_TABLE = "rates_all"
+
+RATE_COLUMN_TYPES = {
+    "POL": "STRING", "Carrier": "STRING", "T_T_TO_POD": "STRING", "Destination": "STRING",
+    "Effective_Date": "DATE", "Expiring_Date": "DATE",
+    "GP20": "FLOAT64", "GP40": "FLOAT64", "HQ40": "FLOAT64", "HQ45": "FLOAT64",
+    "COMM": "STRING", "COMM_DETAILS": "STRING", "COMMODITY": "STRING", "remark": "STRING",
+}
+ROUTE_KEY_COLUMNS = ["POL", "Destination", "Carrier"]
+
+def upload_schema():
+    """ Fixed schema of the per-file tables, so no column changes type with the contents of one sheet """
+    return [bigquery.SchemaField(col, col_type) for col, col_type in RATE_COLUMN_TYPES.items()]
+
+def consolidated_table_sql(dataset_ref: str, target: str, sources: dict) -> str:
+    """ CREATE OR REPLACE statement for `target` from {logical table: (physical table, column names)} """
+    selects = []
+    for logical, (physical, columns) in sorted(sources.items()):
+        if not re.fullmatch(r"[a-z0-9_]+", logical):
+            raise ValueError(f"unexpected table name: {logical!r}")
+        exprs = []
+        for col, col_type in RATE_COLUMN_TYPES.items():
+            value = f"SAFE_CAST(`{col}` AS {col_type})" if col in columns else f"CAST(NULL AS {col_type})"
+            if col in ROUTE_KEY_COLUMNS:
+                value = f"UPPER(TRIM({value}))"  # stored normalized, so lookups can filter on the raw column
+            exprs.append(f"{value} AS `{col}`")
+        exprs.append(f"'{logical}' AS source_table")
+        selects.append(f"SELECT {', '.join(exprs)} FROM `{dataset_ref}.{physical}`")
+    return (
+        f"CREATE OR REPLACE TABLE `{dataset_ref}.{target}`\n"
+        f"PARTITION BY Expiring_Date\n"
+        f"CLUSTER BY {', '.join(ROUTE_KEY_COLUMNS)}\n"
+        f"AS\n" + "\nUNION ALL\n".join(selects)
+    )
+
+def build_consolidated_table(client, dataset_ref: str, active: dict, version: str) -> str:
+    """ Build the consolidated table of this version from {logical table: physical table}, returns its physical name """
+    sources = {}
+    for logical, physical in active.items():
+        schema = client.get_table(f"{dataset_ref}.{physical}").schema
+        sources[logical] = (physical, {field.name for field in schema})
+    target = versioned_table_name(CONSOLIDATED_TABLE, version)
+    client.query(consolidated_table_sql(dataset_ref, target, sources)).result()
+    return target
+
+# ---------------------------
+# Quarantine
+# ---------------------------
+# Rate cells the cleaning could not turn into a plain amount ("AT COST", "1250+BAF", ...),
+# one row per cell with the reason, for people to review. Not part of the rate set.
+
+QUARANTINE_TABLE = "_rate_quarantine"
+
+def upload_quarantine(client, dataset_ref: str, df):
+    job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    client.load_table_from_dataframe(df, f"{dataset_ref}.{QUARANTINE_TABLE}", job_config=job_config).result()
@@ -0,0 +1,74 @@
+"""
+Persistent raw → canonical cache for the POL / Carrier / Destination matching.
+
+Agents reuse the same wording week after week, so every mapping the resolvers in
+ratesheet_cleaning.py produce is kept in a local SQLite file. Rows are keyed by a
+fingerprint of the reference table and threshold they were computed with; when
+the table changes the fingerprint changes, the old rows are dropped and the
+values are matched again.
+"""
+import os
+import json
+import hashlib
+import sqlite3
+
+
+def table_fingerprint(*parts):
+    """ Stable hash of the reference data (alias tables, threshold, ...) a mapping depends on """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class NormalizationCache:
+    def __init__(self, path):
+        self.path = str(path)
+        self._conn = None
+        self._pid = None
+        self._pruned = set()
+
+    def _connection(self):
+        # one connection per process, forked pool workers must not share the parent's handle
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS normalization ("
+                " kind TEXT NOT NULL, fingerprint TEXT NOT NULL, raw TEXT NOT NULL, canonical TEXT NOT NULL,"
+                " PRIMARY KEY (kind, raw))"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _prune(self, conn, kind, fingerprint):
+        # rows computed from an older reference table are stale
+        if (kind, fingerprint) not in self._pruned:
+            with conn:
+                conn.execute("DELETE FROM normalization WHERE kind = ? AND fingerprint != ?", (kind, fingerprint))
+            self._pruned.add((kind, fingerprint))
+
+    def lookup(self, kind, fingerprint, raws):
+        """ {raw: canonical} for the raw strings already cached under this fingerprint """
+        conn = self._connection()
+        self._prune(conn, kind, fingerprint)
+        found = {}
+        raws = list(raws)
+        for start in range(0, len(raws), 500):  # stay under SQLite's bound-parameter limit
+            chunk = raws[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT raw, canonical FROM normalization WHERE kind = ? AND fingerprint = ? AND raw IN ({placeholders})",
+                [kind, fingerprint, *chunk],
+            )
+            found.update(rows)
+        return found
+
+    def store(self, kind, fingerprint, mapping):
+        if not mapping:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO normalization (kind, fingerprint, raw, canonical) VALUES (?, ?, ?, ?)",
+                [(kind, fingerprint, raw, canonical) for raw, canonical in mapping.items()],
+            )
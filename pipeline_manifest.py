@@ -0,0 +1,80 @@
+"""
+Content-hash manifest for incremental pipeline runs.
+
+For every source workbook the manifest remembers the sha256 of its bytes, the
+pipeline version it was cleaned with, the cleaned file written to Cleaned/ and the
+table it was uploaded to. A run then only has to clean and upload the new or changed
+workbooks, and can drop the outputs of workbooks that disappeared.
+
+Entries are kept per storage target (the BigQuery dataset or the SQLite file): a
+workbook uploaded to one target is still new to another, so switching --storage
+uploads the whole rate set once instead of finding every file unchanged.
+
+The file is JSON but deliberately not named *.json: RateGeneratorJuly15.py picks
+up the first *.json under the project as the service account credentials.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PipelineManifest:
+    def __init__(self, path, target):
+        self.path = str(path)
+        self.targets = {}  # storage target -> {source name: entry}
+        self.hashes = {}   # source path -> content hash computed during plan()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.targets = json.load(f).get("targets", {})
+        self.sources = self.targets.setdefault(target, {})
+
+    def plan(self, paths, pipeline_version, full_refresh=False):
+        """
+        Split `paths` into changed (new, edited or cleaned with another pipeline version) and unchanged
+        files, and list the manifest entries whose source workbook is gone.
+        Returns {"changed": [path], "unchanged": [path], "removed": {source name: entry}}.
+        """
+        changed, unchanged = [], []
+        names = set()
+        for path in paths:
+            name = os.path.basename(path)
+            names.add(name)
+            self.hashes[path] = file_hash(path)
+            entry = self.sources.get(name)
+            if (not full_refresh and entry
+                    and entry["content_hash"] == self.hashes[path]
+                    and entry["pipeline_version"] == pipeline_version):
+                unchanged.append(path)
+            else:
+                changed.append(path)
+        removed = {name: entry for name, entry in self.sources.items() if name not in names}
+        return {"changed": changed, "unchanged": unchanged, "removed": removed}
+
+    def record(self, path, pipeline_version, output_table, cleaned_path):
+        """ Mark `path` as processed, call only once its outputs are written and uploaded """
+        self.sources[os.path.basename(path)] = {
+            "content_hash": self.hashes.get(path) or file_hash(path),
+            "pipeline_version": pipeline_version,
+            "output_table": output_table,
+            "cleaned_path": str(cleaned_path),
+            "processed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+
+    def forget(self, name):
+        self.sources.pop(name, None)
+
+    def save(self):
+        # write then rename, so an interrupted run never leaves a truncated manifest
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"targets": self.targets}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,171 @@
+"""
+Fee schedule and all-in pricing for the rate sheet page.
+
+Surcharges are data: every rule names the fee column it shows up in, an amount in USD
+or a percentage of the container's ocean freight, the containers it applies to and
+optional Sheet type / Carrier / POL conditions. price_routes() applies the whole
+schedule to the matched rows at once, one array operation per rule.
+
+A rule whose fee is an ocean freight column (GP20 / GP40) marks that freight up or
+down instead of adding a fee column: the page's price adjustment is such a rule, so
+the all-in totals include it.
+
+A schedule can be kept in a CSV file with the RULE_COLUMNS header; multiple values
+of a condition are separated by "|", an empty condition matches every row.
+"""
+import numpy as np
+import pandas as pd
+
+RULE_COLUMNS = ["fee", "amount", "unit", "container", "sheet_type", "carrier", "pol"]
+
+# container -> (ocean freight column, all-in column)
+CONTAINERS = {
+    "20": ("GP20", "20' - ALL IN"),
+    "40": ("GP40", "40' or HC - ALL IN"),
+}
+# ocean freight column -> container, the fee of a markup rule
+FREIGHT_COLUMNS = {freight: size for size, (freight, _) in CONTAINERS.items()}
+
+# which frame column each rule condition is checked against
+CONDITION_COLUMNS = {"sheet_type": "Sheet type", "carrier": "Carrier", "pol": "POL"}
+
+DEFAULT_FEE_RULES = [
+    {"fee": "ISF", "amount": 25},
+    {"fee": "Handling", "amount": 50},
+    {"fee": "Customs Clearance", "amount": 80},
+    {"fee": "Duty", "amount": "AT COST"},
+    {"fee": "20' - CTF/PP", "amount": 48, "container": "20", "sheet_type": "Port to Door"},
+    {"fee": "40' - CTF/PP", "amount": 95, "container": "40", "sheet_type": "Port to Door"},
+    {"fee": "Chassis ($50/DAY) - min. 2 days", "amount": 100, "sheet_type": "Port to Door"},
+]
+
+
+UNITS = ["USD", "%"]
+
+
+def _rule_field(col, default):
+    # blank CSV cells come in as "", list rules as None / NaN; whole numbers such as 20.0 as "20"
+    text = col.map(lambda v: f"{v:g}" if isinstance(v, float) and not np.isnan(v) else v)
+    text = text.astype("string").str.strip()
+    return text.mask(text.isna() | (text == ""), default).astype(object)
+
+
+def fee_rules(rules=None):
+    """
+    Rules (list of dicts or DataFrame, DEFAULT_FEE_RULES if None) as a frame with every RULE_COLUMNS column.
+    Raises ValueError for a container or unit price_routes() cannot apply, for a fee column whose rules
+    mix USD and %, and for a markup rule on another container than its freight column's.
+    """
+    rules = pd.DataFrame(DEFAULT_FEE_RULES if rules is None else rules)
+    rules = rules.reindex(columns=RULE_COLUMNS)
+    rules["unit"] = _rule_field(rules["unit"], "USD")
+    rules["container"] = _rule_field(rules["container"], "all")
+    for col, allowed in (("unit", UNITS), ("container", ["all", *CONTAINERS])):
+        unknown = sorted(set(rules[col]) - set(allowed))
+        if unknown:
+            raise ValueError(f"unknown fee rule {col} {unknown}, expected one of {allowed}")
+    markup_size = rules["fee"].map(FREIGHT_COLUMNS)
+    # a fee column shows either amounts or "x%", markups only change the freight
+    units = rules[markup_size.isna()].groupby("fee", sort=True)["unit"].unique()
+    mixed = units[units.map(len) > 1]
+    if not mixed.empty:
+        raise ValueError(f"fee rules mix USD and % in one column: {', '.join(mixed.index)}")
+    wrong = markup_size.notna() & (rules["container"] != "all") & (rules["container"] != markup_size)
+    if wrong.any():
+        raise ValueError(f"markup rule on {', '.join(sorted(set(rules.loc[wrong, 'fee'])))} for another container")
+    rules["container"] = markup_size.fillna(rules["container"])
+    return rules
+
+
+def load_fee_rules(path):
+    return fee_rules(pd.read_csv(path, dtype=str, keep_default_na=False))
+
+
+def _condition_values(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value == "":
+        return None
+    if isinstance(value, str):
+        return [v.strip().upper() for v in value.split("|") if v.strip()]
+    return [str(v).strip().upper() for v in value]
+
+
+def _condition_mask(col, values):
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        # test the few categories, then look the rows up by code
+        hit = col.cat.categories.astype(str).str.strip().str.upper().isin(values)
+        codes = col.cat.codes.to_numpy()
+        return np.where(codes >= 0, hit[codes], False)
+    return col.astype(str).str.strip().str.upper().isin(values).to_numpy()
+
+
+def _amount(value):
+    """ Numeric amount of a rule, None for informational amounts such as "AT COST" """
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(amount) else amount
+
+
+def _fee_column(values):
+    # float column when every shown amount is a number, so the fees stay summable downstream
+    numeric = pd.to_numeric(pd.Series(values), errors="coerce")
+    return numeric.to_numpy() if numeric.notna().sum() == pd.notna(values).sum() else values
+
+
+def price_routes(df, rules):
+    """
+    Fee columns and all-in totals for every row of `df` under `rules` (see fee_rules()).
+    A row pays a rule when it meets all of the rule's conditions; amounts of rules that share a fee
+    column add up. Informational amounts are shown in their column but never added to a total.
+    Markup rules change the freight column and its total, % rules are a share of the freight as loaded.
+    Returns a new frame.
+    """
+    rules = fee_rules(rules)
+    n = len(df)
+    base = {size: pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) if col in df.columns
+            else np.full(n, np.nan) for size, (col, _) in CONTAINERS.items()}
+    totals = {size: values.copy() for size, values in base.items()}
+    freight = {size: values.copy() for size, values in base.items()}
+    fee_columns = {}
+
+    for rule in rules.itertuples(index=False):
+        mask = np.ones(n, dtype=bool)
+        for field, col in CONDITION_COLUMNS.items():
+            values = _condition_values(getattr(rule, field))
+            if values is not None:
+                if col not in df.columns:
+                    mask[:] = False
+                    break
+                mask &= _condition_mask(df[col], values)
+
+        amount = _amount(rule.amount)
+        if rule.fee in FREIGHT_COLUMNS:
+            if amount is not None:
+                size = FREIGHT_COLUMNS[rule.fee]
+                added = base[size] * amount / 100 if rule.unit == "%" else amount
+                freight[size] = np.where(mask, freight[size] + added, freight[size])
+                totals[size] = np.where(mask, totals[size] + added, totals[size])
+            continue
+
+        shown = fee_columns.setdefault(rule.fee, np.full(n, np.nan, dtype=object))
+        if amount is None:
+            shown[mask] = rule.amount
+            continue
+        if rule.unit == "%":
+            shown[mask] = f"{amount:g}%"
+        else:
+            current = pd.to_numeric(pd.Series(shown), errors="coerce").fillna(0).to_numpy()
+            shown[mask] = current[mask] + amount
+
+        sizes = CONTAINERS if rule.container == "all" else [rule.container]
+        for size in sizes:
+            added = base[size] * amount / 100 if rule.unit == "%" else amount
+            totals[size] = np.where(mask, totals[size] + added, totals[size])
+
+    columns = {fee: _fee_column(values) for fee, values in fee_columns.items()}
+    for size, (freight_col, total_col) in CONTAINERS.items():
+        if freight_col in df.columns:
+            columns[freight_col] = freight[size]
+        columns[total_col] = totals[size]
+    return df.drop(columns=[c for c in columns if c in df.columns]).assign(**columns)
@@ -0,0 +1,328 @@
+"""
+Storage backends for the rate tables.
+
+RateGeneratorJuly15.py and streamlit_app.py only talk to a RateStorage:
+
+- BigQueryStorage is the production dataset, built on the helpers in bigquery_utils.py
+  (concurrent load jobs, versioned tables, the pointer table and the consolidated table).
+- SQLiteStorage keeps the same tables, pointer table and consolidated table in one local
+  SQLite file. The pipeline can write to it offline, the app can answer route lookups
+  in-process, and tests and benchmarks get a stand-in that needs no network.
+
+Filters are the (column, values) pairs of streamlit_app.filter_key(); values that are
+all dates are compared on the date part of the column.
+"""
+import os
+import re
+import time
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+from bigquery_utils import (
+    POINTER_TABLE, CONSOLIDATED_TABLE, RATE_COLUMN_TYPES, ROUTE_KEY_COLUMNS,
+    upload_dataframes, upload_schema, read_table_versions, promote_table_versions, build_consolidated_table, pointer_rows,
+    versioned_table_name,
+)
+
+# table and column names cannot be query parameters, they are checked before they go into SQL
+IDENTIFIER = re.compile(r"[A-Za-z0-9_]+")
+PROJECT_ID = re.compile(r"[a-z][a-z0-9.:-]*[a-z0-9]")
+# physical tables of the versioned pipeline (<table>__v<run version>) are never rewritten
+VERSIONED_TABLE = re.compile(r".+__v\d{8}T\d{6}")
+
+
+def _identifier(name):
+    if not IDENTIFIER.fullmatch(name or ""):
+        raise ValueError(f"unexpected table or column name: {name!r}")
+    return name
+
+
+def _is_dates(values):
+    return bool(values) and all(isinstance(v, (pd.Timestamp, np.datetime64)) or hasattr(v, "isoformat") for v in values)
+
+
+def _is_numbers(values):
+    return bool(values) and all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values)
+
+
+class RateStorage:
+    """ Operations the pipeline and the app need, implemented by every backend """
+
+    def list_tables(self):
+        raise NotImplementedError
+
+    def table_columns(self, table_name):
+        raise NotImplementedError
+
+    def table_version(self, table_name):
+        """ Freshness token: the name of a versioned table, the last modification time of any other """
+        raise NotImplementedError
+
+    def read_table(self, table_name, columns=None, filters=(), distinct=False, not_before=()):
+        """
+        Rows of `table_name`, only `columns` (missing ones skipped) and rows matching every filter;
+        with distinct=True each combination of the columns once. `not_before` (column, date) pairs
+        keep the rows dated on or after the date, or not dated at all.
+        """
+        raise NotImplementedError
+
+    def write_tables(self, frames, max_workers=8, rate_schema=True):
+        """
+        Replace {table name: DataFrame or callable returning one}, with the fixed rate table schema
+        unless rate_schema is False. Returns upload_dataframes()-style results.
+        """
+        raise NotImplementedError
+
+    def write_table(self, table_name, df, rate_schema=False):
+        result = self.write_tables({table_name: df}, max_workers=1, rate_schema=rate_schema)[table_name]
+        if not result["ok"]:
+            raise RuntimeError(f"writing {table_name} failed: {result['error']}")
+
+    def delete_table(self, table_name):
+        raise NotImplementedError
+
+    def read_table_versions(self):
+        """ {"active": {logical: physical}, "retired": {physical: version that retired it}}, None before the first promote """
+        raise NotImplementedError
+
+    def promote_table_versions(self, active, retired, version):
+        """ Point readers at `active`; `retired` is {physical: retired version} or a list retired by `version` """
+        raise NotImplementedError
+
+    def build_consolidated_table(self, active, version):
+        """ Build the consolidated table of `version` from {logical: physical}, returns its physical name """
+        raise NotImplementedError
+
+
+class BigQueryStorage(RateStorage):
+    def __init__(self, client, dataset_ref):
+        project_id, _, dataset = dataset_ref.partition(".")
+        if not PROJECT_ID.fullmatch(project_id or ""):
+            raise ValueError(f"unexpected project id: {project_id!r}")
+        _identifier(dataset)
+        self.client = client
+        self.dataset_ref = dataset_ref
+
+    def _ref(self, table_name):
+        return f"{self.dataset_ref}.{_identifier(table_name)}"
+
+    def list_tables(self):
+        return [t.table_id for t in self.client.list_tables(self.dataset_ref)]
+
+    def table_columns(self, table_name):
+        return [field.name for field in self.client.get_table(self._ref(table_name)).schema]
+
+    def table_version(self, table_name):
+        if VERSIONED_TABLE.fullmatch(table_name):
+            return table_name
+        return self.client.get_table(self._ref(table_name)).modified.isoformat()
+
+    @staticmethod
+    def _filter_param(name, values):
+        # dates are compared as DATE whatever the column type (DATE, DATETIME or TIMESTAMP) is
+        if _is_dates(values):
+            return "DATE({col})", bigquery.ArrayQueryParameter(name, "DATE", [pd.Timestamp(v).date() for v in values])
+        if _is_numbers(values):
+            return "{col}", bigquery.ArrayQueryParameter(name, "FLOAT64", [float(v) for v in values])
+        return "{col}", bigquery.ArrayQueryParameter(name, "STRING", [str(v) for v in values])
+
+    def read_table(self, table_name, columns=None, filters=(), distinct=False, not_before=()):
+        available = self.table_columns(table_name)
+        if columns is not None:
+            columns = [col for col in columns if col in available]
+        select = ", ".join(f"`{col}`" for col in columns) if columns else "*"
+        conditions, params = [], []
+        for i, (col, values) in enumerate(filters):
+            if col not in available:
+                raise ValueError(f"unknown column {col!r} in {table_name}")
+            expr, param = self._filter_param(f"p{i}", list(values))
+            conditions.append(f"{expr.format(col=f'`{col}`')} IN UNNEST(@p{i})")
+            params.append(param)
+        for i, (col, day) in enumerate(not_before):
+            if col not in available:
+                raise ValueError(f"unknown column {col!r} in {table_name}")
+            # the bare column, so BigQuery prunes the partitions of a table partitioned by it
+            conditions.append(f"(`{col}` >= @d{i} OR `{col}` IS NULL)")
+            params.append(bigquery.ScalarQueryParameter(f"d{i}", "DATE", pd.Timestamp(day).date()))
+        query = f"SELECT {'DISTINCT ' if distinct else ''}{select} FROM `{self._ref(table_name)}`"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        job_config = bigquery.QueryJobConfig(query_parameters=params)
+        return self.client.query(query, job_config=job_config).to_dataframe()
+
+    def write_tables(self, frames, max_workers=8, rate_schema=True):
+        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        if rate_schema:
+            job_config.schema = upload_schema()  # rates FLOAT64, dates DATE, the rest STRING
+        results = upload_dataframes(self.client, {self._ref(name): frame for name, frame in frames.items()},
+                                    max_workers=max_workers, job_config=job_config)
+        return {name: results[self._ref(name)] for name in frames}
+
+    def delete_table(self, table_name):
+        self.client.delete_table(self._ref(table_name), not_found_ok=True)
+
+    def read_table_versions(self):
+        return read_table_versions(self.client, self.dataset_ref)
+
+    def promote_table_versions(self, active, retired, version):
+        promote_table_versions(self.client, self.dataset_ref, active, retired, version)
+
+    def build_consolidated_table(self, active, version):
+        return build_consolidated_table(self.client, self.dataset_ref, active, version)
+
+
+class SQLiteStorage(RateStorage):
+    # every table's last write, the freshness token of tables that are not versioned
+    META_TABLE = "_table_meta"
+    SQLITE_TYPES = {"STRING": "TEXT", "FLOAT64": "REAL", "DATE": "TEXT"}
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    @contextmanager
+    def _connect(self):
+        # one short-lived connection per call, Streamlit runs every session in its own thread
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.META_TABLE} (table_name TEXT PRIMARY KEY, modified TEXT NOT NULL)")
+            with conn:  # commit on success, roll back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def list_tables(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != ?", (self.META_TABLE,))
+            return [name for (name,) in rows]
+
+    def table_columns(self, table_name):
+        with self._connect() as conn:
+            return [row[1] for row in conn.execute(f'PRAGMA table_info("{_identifier(table_name)}")')]
+
+    def table_version(self, table_name):
+        if VERSIONED_TABLE.fullmatch(table_name):
+            return table_name
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT modified FROM {self.META_TABLE} WHERE table_name = ?", (table_name,)).fetchone()
+        return row[0] if row else ""
+
+    def read_table(self, table_name, columns=None, filters=(), distinct=False, not_before=()):
+        available = self.table_columns(table_name)
+        if columns is not None:
+            columns = [col for col in columns if col in available]
+        select = ", ".join(f'"{col}"' for col in columns) if columns else "*"
+        conditions, params = [], []
+        for col, values in filters:
+            if col not in available:
+                raise ValueError(f"unknown column {col!r} in {table_name}")
+            values = list(values)
+            if _is_dates(values):
+                expr, values = f'date("{col}")', [pd.Timestamp(v).strftime("%Y-%m-%d") for v in values]
+            else:
+                expr = f'"{col}"'
+                values = [float(v) for v in values] if _is_numbers(values) else [str(v) for v in values]
+            conditions.append(f"{expr} IN ({', '.join('?' * len(values))})" if values else "0")
+            params.extend(values)
+        for col, day in not_before:
+            if col not in available:
+                raise ValueError(f"unknown column {col!r} in {table_name}")
+            conditions.append(f'(date("{col}") >= ? OR "{col}" IS NULL)')
+            params.append(pd.Timestamp(day).strftime("%Y-%m-%d"))
+        query = f'SELECT {"DISTINCT " if distinct else ""}{select} FROM "{_identifier(table_name)}"'
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._connect() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def _touch(self, conn, table_name):
+        conn.execute(f"INSERT OR REPLACE INTO {self.META_TABLE} (table_name, modified) VALUES (?, ?)",
+                     (table_name, datetime.now(timezone.utc).isoformat()))
+
+    def write_tables(self, frames, max_workers=8, rate_schema=True):
+        # SQLite has one writer at a time, tables are written one after the other
+        results = {}
+        for table_name, frame in frames.items():
+            start = time.monotonic()
+            try:
+                df = frame() if callable(frame) else frame
+                with self._connect() as conn:
+                    df.to_sql(_identifier(table_name), conn, if_exists="replace", index=False)
+                    self._touch(conn, table_name)
+                results[table_name] = {"ok": True, "seconds": round(time.monotonic() - start, 3), "attempts": 1, "error": None}
+            except Exception as exc:
+                results[table_name] = {"ok": False, "seconds": round(time.monotonic() - start, 3), "attempts": 1,
+                                       "error": f"{type(exc).__name__}: {exc}"}
+        return results
+
+    def delete_table(self, table_name):
+        with self._connect() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{_identifier(table_name)}"')
+            conn.execute(f"DELETE FROM {self.META_TABLE} WHERE table_name = ?", (table_name,))
+
+    def read_table_versions(self):
+        if POINTER_TABLE not in self.list_tables():
+            return None
+        versions = {"active": {}, "retired": {}}
+        for row in self.read_table(POINTER_TABLE).itertuples(index=False):
+            if row.status == "active":
+                versions["active"][row.logical_table] = row.physical_table
+            else:
+                versions["retired"][row.physical_table] = row.version
+        return versions
+
+    def promote_table_versions(self, active, retired, version):
+        # one transaction, readers see the old pointer rows or the new ones
+        rows = pointer_rows(active, retired, version)
+        with self._connect() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {POINTER_TABLE} "
+                         "(logical_table TEXT, physical_table TEXT, status TEXT, version TEXT)")
+            conn.execute(f"DELETE FROM {POINTER_TABLE}")
+            conn.executemany(f"INSERT INTO {POINTER_TABLE} VALUES (?, ?, ?, ?)", rows)
+            self._touch(conn, POINTER_TABLE)
+
+    def build_consolidated_table(self, active, version):
+        target = versioned_table_name(CONSOLIDATED_TABLE, version)
+        column_list = ", ".join(f'"{col}"' for col in RATE_COLUMN_TYPES)
+        inserts = []
+        for logical, physical in sorted(active.items()):
+            columns = set(self.table_columns(physical))
+            exprs = []
+            for col, col_type in RATE_COLUMN_TYPES.items():
+                sqlite_type = self.SQLITE_TYPES[col_type]
+                value = f'CAST("{col}" AS {sqlite_type})' if col in columns else "NULL"
+                if col_type == "DATE" and col in columns:
+                    value = f'date("{col}")'
+                if col in ROUTE_KEY_COLUMNS:
+                    value = f"UPPER(TRIM({value}))"  # stored normalized, like the BigQuery table
+                exprs.append(value)
+            inserts.append((f'INSERT INTO "{target}" ({column_list}, source_table) '
+                            f'SELECT {", ".join(exprs)}, ? FROM "{_identifier(physical)}"', logical))
+        definitions = ", ".join(f'"{col}" {self.SQLITE_TYPES[col_type]}' for col, col_type in RATE_COLUMN_TYPES.items())
+        with self._connect() as conn:
+            # one INSERT per table instead of one UNION ALL, which SQLite caps at 500 terms;
+            # a single transaction, so a failed table leaves no half-built target behind
+            conn.execute("BEGIN")
+            conn.execute(f'DROP TABLE IF EXISTS "{target}"')
+            conn.execute(f'CREATE TABLE "{target}" ({definitions}, source_table TEXT)')
+            for sql, logical in inserts:
+                conn.execute(sql, (logical,))
+            # stands in for BigQuery's clustering: route lookups are index range scans
+            conn.execute(f'CREATE INDEX "{target}_route" ON "{target}" ({", ".join(ROUTE_KEY_COLUMNS)})')
+            self._touch(conn, target)
+        return target
+
+
+def open_storage(backend, client=None, dataset_ref=None, sqlite_path=None):
+    """ Storage for a backend name, "bigquery" (needs client and dataset_ref) or "sqlite" (needs sqlite_path) """
+    if backend == "bigquery":
+        return BigQueryStorage(client, dataset_ref)
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"unknown storage backend: {backend!r}")
@@ -0,0 +1,833 @@
+"""
+Per-file cleaning chain for agent rate sheets.
+
+Everything that turns one raw agent workbook into a cleaned DataFrame lives here
+(header detection, column cleanup, POL / Carrier / Destination matching, date
+standardization and numeric rates), so that RateGeneratorJuly15.py can run it either one file at a
+time or across a process pool.
+"""
+import os
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+from rapidfuzz import fuzz, process
+
+from alias_matcher import AliasMatcher
+from normalization_cache import NormalizationCache, table_fingerprint
+
+
+# ---------------------------
+# Reference Tables
+# ---------------------------
+
+# ports names "Yantian, Shenzhen": ["yantian", "YTN"],
+port_aliases = {
+    "SHENZHEN, GUANGDONG": ["shekou", "SHK", "yantian", "YTN"],
+    "JIUJIANG, GUANGDONG": ["jiujiang", "JJG"],
+    "HONG KONG": ["hong kong", "HKG"],
+    "ZHUHAI, GUANGDONG": ["zhuhai", "ZUH"],
+    "ZHONGSHAN, GUANGDONG": ["zhongshan", "ZSN"],
+    "NANSHA, GUANGDONG": ["nansha", "NSA"],
+    "HUANGPU, GUANGDONG": ["huangpu", "HUP"],
+    "XIAMEN, FUJIAN": ["xiamen", "XMN"],
+    "FUZHOU, FUJIAN": ["fuzhou", "FOC"],
+    "ZHENJIANG, JIANGSU": ["zhenjiang", "ZJG"],
+    "ZHAPU, ZHEJIANG": ["zhapu", "ZPU"],
+    "ZHANGJIAGANG, JIANGSU": ["zhangjiagang", "ZJG"],
+    "YUEYANG, HUNAN": ["yueyang", "YYG"],
+    "YICHANG, HUBEI": ["yichang", "YIC"],
+    "YANGZHOU, JIANGSU": ["yangzhou", "YZH"],
+    "WUHU, ANHUI": ["wuhu", "WHU"],
+    "WUHAN, HUBEI": ["wuhan", "WUH"],
+    "SHANGHAI": ["shanghai", "SHA"],
+    "NINGBO, ZHEJIANG": ["ningbo", "NGB"],
+    "NANTONG, JIANGSU": ["nantong", "NTG"],
+    "NANJING, JIANGSU": ["nanjing", "NKG"],
+    "NANCHANG, JIANGXI": ["nanchang", "NCG"],
+    "CHANGZHOU, JIANGSU": ["changzhou", "CZH"],
+    "CHANGSHA, HUNAN": ["changsha", "CSX"],
+    "ANQING, ANHUI": ["anqing", "AQG"],
+    "XINGANG, TIANJIN": ["xingang", "XGG"],
+    "QINGDAO, SHANDONG": ["qingdao", "QDG"],
+    "DALIAN, LIAONING": ["dalian", "DLC"],
+    "YOKOHAMA, JAPAN": ["yokohama", "YOK"],
+    "VUNG TAU, VIETNAM": ["vung tau", "VUT"],
+    "VISAKHAPATNAM, INDIA": ["visakhapatnam", "VSK"],
+    "TUTICORIN, INDIA": ["tuticorin", "TUT"],
+    "TOKYO, JAPAN": ["tokyo", "TYO"],
+    "TAOYUAN, TAIWAN": ["taoyuan", "TYN"],
+    "TANJUNG PELEPAS, MALAYSIA": ["tanjung pelepas", "TPP"],
+    "TAIPEI, TAIWAN": ["taipei", "TPE"],
+    "TAICHUNG, TAIWAN": ["taichung", "TXG"],
+    "SURABAYA, INDONESIA": ["surabaya", "SUB"],
+    "SUBIC BAY, PHILIPPINES": ["subic bay", "SUB"],
+    "SINGAPORE": ["singapore", "SIN"],
+    "SIHANOUKVILLE, CAMBODIA": ["sihanoukville", "SIH"],
+    "SHIMIZU, JAPAN": ["shimizu", "SZU"],
+    "SEMARANG, INDONESIA": ["semarang", "SRG"],
+    "QUI NHON, VIETNAM": ["qui nhon", "QNH"],
+    "PORT KLANG, MALAYSIA": ["port klang", "PKL"],
+    "PHNOM PENH, CAMBODIA": ["phnom penh", "PNH"],
+    "PENANG, MALAYSIA": ["penang", "PEN"],
+    "PASIR GUDANG, MALAYSIA": ["pasir gudang", "PGU"],
+    "PALEMBANG, INDONESIA": ["palembang", "PLM"],
+    "OSAKA, JAPAN": ["osaka", "OSA"],
+    "NHAVA SHEVA, INDIA": ["nhava sheva", "NSH"],
+    "NAGOYA, JAPAN": ["nagoya", "NGO"],
+    "MUNDRA, INDIA": ["mundra", "MUN"],
+    "MOJI, JAPAN": ["moji", "MOJ"],
+    "MANILA, PHILIPPINES": ["manila", "MNL"],
+    "MANILA NORTH HARBOUR": ["manila north harbour", "MNH"],
+    "LAT KRABANG, THAILAND": ["lat krabang", "LKB"],
+    "LAEM CHABANG, THAILAND": ["laem chabang", "LCH"],
+    "KOLKATA(EX CALCUTTA), INDIA": ["kolkata(ex calcutta)", "CCU"],
+    "KOBE, JAPAN": ["kobe", "UKB"],
+    "KEELUNG, TAIWAN": ["keelung", "KEL"],
+    "KARACHI, PAKISTAN": ["karachi", "KHI"],
+    "KAOHSIUNG, TAIWAN": ["kaohsiung", "KHH"],
+    "JAKARTA, INDONESIA": ["jakarta", "JKT"],
+    "HOCHIMINH CITY, VIETNAM": ["hochiminh city", "SGN"],
+    "HAKATA, JAPAN": ["hakata", "HAK"],
+    "HAIPHONG, VIETNAM": ["haiphong", "HPH"],
+    "DAVAO, PHILIPPINES": ["davao", "DVO"],
+    "DANANG, VIETNAM": ["danang", "DAD"],
+    "COLOMBO, SRI LANKA": ["colombo", "CMB"],
+    "COCHIN, INDIA": ["cochin", "COK"],
+    "CHATTOGRAM, BANGLADESH": ["chattogram", "CGP"],
+    "CHENNAI, INDIA": ["chennai", "MAA"],
+    "CEBU, PHILIPPINES": ["cebu", "CEB"],
+    "CAI MEP, VIETNAM": ["cai mep", "CMV"],
+    "BUSAN, KOREA": ["busan", "PUS"],
+    "BELAWAN, INDONESIA": ["belawan", "BLW"],
+    "BATAM, INDONESIA": ["batam", "BTH"],
+    "BANGKOK, THAILAND": ["bangkok", "BKK"],
+    "PANJANG, INDONESIA": ["panjang", "PNJ"],
+    "PIPAVAV (VICTOR) PORT, INDIA": ["pipavav (victor) port", "PIP"],
+    "HAZIRA, INDIA": ["hazira", "HZR"],
+    "KATTUPALLI, INDIA": ["kattupalli", "KTP"]
+}
+
+
+# carriers names and their possible aliases or SCAC codes
+carrier_aliases = {
+    "WANHAI": ["WHLC", "WANHAI", "WHAI"],
+    "TSL": ["TSYN", "TSL"],
+    "SMLM": ["SML", "SMLM"],
+    "YML": ["YMJA", "YML"],
+    "MSC": ["MEDU", "MSC"],
+    "OOCL": ["OOLU", "OOCL"],
+    "ONE": ["ONEY", "ONE"],
+    "EMC": ["EGLV", "EMC"],
+    "COSCO": ["COSU", "COSCO"],
+    "HMM": ["HDMU", "HMM"],
+    "HPL": ["HLCU", "HPL"],
+    "CMA": ["CMDU", "CMA", "CMU"],
+    "ZIM": ["ZIMU", "ZIM"],
+    "SLS": ["SLS"],
+    "HEDE": ["HEDE"],
+    "MATS": ["MATS", "MATSON"],
+}
+
+
+# Create a mapping of keywords to standardized city names
+city_mapping_keywords = {
+    "LAX/LGB": "LOS ANGELES, LAX, LGB, LAX/LGB, LONG BEACH",
+    "CHICAGO, IL": "CHICAGO, JOLIET, CHI, USCHI",
+    "NEW YORK, NY": "NEW YORK, NYC, USNYC",
+    "DALLAS, TX": "DALLAS, USDAL, DAL",
+    "HOUSTON, TX": "HOUSTON",
+    "SEATTLE, WA": "SEATTLE",
+    "TACOMA, WA":"TACOMA",
+    "OAKLAND, CA": "OAKLAND",
+    "MIAMI, FL": "MIAMI",
+    "HONOLULU, HI": "HONOLULU",
+    "CLEVELAND, OH": "CLEVELAND",
+    "BALTIMORE, MD": "BALTIMORE",
+    "CHARLESTON, SC": "CHARLESTON",
+    "PORTLAND, OR": "PORTLAND",
+    "MEMPHIS, TN": "MEMPHIS",
+    "SAVANNAH, GA": "SAVANNAH",
+    "PHILADELPHIA, PA": "PHILADELPHIA",
+    "ATLANTA, GA": "ATLANTA",
+    "INDIANAPOLIS, IN": "INDIANAPOLIS",
+    "DETROIT, MI": "DETROIT",
+    "TAMPA, FL": "TAMPA",
+    "SAINT LOUIS, MO": "SAINT LOUIS",
+    "JACKSONVILLE, FL": "JACKSONVILLE",
+    "KANSAS CITY, MO": "KANSAS CITY",
+    "MINNEAPOLIS, MN": "MINNEAPOLIS",
+    "CINCINNATI, OH": "CINCINNATI",
+    "DENVER, CO": "DENVER",
+    "PHOENIX, AZ": "PHOENIX",
+    "SALT LAKE CITY, UT": "SALT LAKE CITY",
+    "NASHVILLE, TN": "NASHVILLE",
+    "OMAHA, NE": "OMAHA",
+    "PITTSBURGH, PA": "PITTSBURGH",
+    "BOSTON, MA": "BOSTON",
+    "BUFFALO, NY": "BUFFALO",
+    "LOUISVILLE, KY": "LOUISVILLE",
+    "EL PASO, TX": "EL PASO",
+    "COLUMBUS, OH": "COLUMBUS",
+    "HILO, HI": "HILO",
+    "KAHULUI, HI": "KAHULUI",
+    "SASKATOON, CANADA": "SASKATOON",
+    "CALGARY, CANADA": "CALGARY",
+    "EDMONTON, CANADA": "EDMONTON",
+    "VANCOUVER, CANADA": "VANCOUVER",
+    "TORONTO, CANADA": "TORONTO",
+    "MONTREAL, CANADA": "MONTREAL",
+    "PRINCE RUPERT, CANADA": "PRINCE RUPERT",
+    "HALIFAX, CANADA": "HALIFAX",
+    "REGINA, CANADA": "REGINA",
+    "WINNIPEG, CANADA": "WINNIPEG",
+}
+
+
+
+# ---------------------------
+# Ingestion
+# ---------------------------
+
+# ✅ Scan the first 10 rows of the parsed sheet to detect the header row
+def detect_header_row(df, max_rows=10):
+    """ Check 'POL' for header row """
+    for i in range(min(len(df), max_rows)):
+        row_str = " ".join(str(v) for v in df.iloc[i])
+        print(f"🔍 Check {i} row: {row_str}") 
+        if "POL" in row_str.upper():  # capitalize for case-insensitive match
+            print(f"✅ FOUND 'POL' at {i} row")
+            return i
+    print("⚠️ Cannot find 'POL'returning default header row 0")
+    return 0 
+
+def read_rate_sheet(path):
+    """ Parse the workbook once, find the header row in memory and slice the body out of the same parse """
+    raw = pd.read_excel(path, header=None, dtype=object)
+    header_row = detect_header_row(raw)
+    stats = {"header_row": header_row, "rows": len(raw), "bytes": os.path.getsize(path)}
+    if raw.empty:
+        return pd.DataFrame(), stats
+
+    # run pandas' own row parser over the in-memory rows, so column names, NA markers
+    # and dtypes come out exactly as pd.read_excel(path, header=header_row) would give
+    rows = raw.iloc[header_row:].astype(object).fillna("").values.tolist()
+    df = TextParser(rows, header=0).read()
+    return df, stats
+
+# ✅ Merge duplicate columns
+def merge_duplicate_columns(df):
+    if 'remark' in df.columns and 'remark' in df.columns:
+        df['remark'] = df['remark'].fillna(df['remark'])  
+        df = df.drop(columns=['remark']) 
+    return df
+
+
+# ---------------------------
+# Column Names
+# ---------------------------
+
+# unify the column name for "remarks" related columns across all dataframes
+def unify_remark_column_name(df):
+    # possible column names for remarks
+    possible_columns = ["Rate remarks", "rate remarks", "REMARK", "REMARKS", "Remark", "Remarks", "remark", "remarks", "Rate_remarks", "RATE_REMARKS", "RATE_REMARK", "Rate_remark", "rate_remarks"]
+
+    # validate and rename the column if it exists
+    for col in possible_columns:
+        if col in df.columns:  #if the column exists in the dataframe
+            df = df.rename(columns={col: 'remark'})
+            break  # exit loop after renaming
+    return df
+
+# Header cleaning function
+def clean_column_names(df):
+    new_columns = []
+    for col in df.columns:
+        col = col.strip()  # strip whitespace
+        col = col.replace(" ", "_")  
+        col = col.replace("/", "_")  
+        col = col.replace("(", "")   
+        col = col.replace(")", "")   
+        col = re.sub(r'_+', '_', col)  
+        col = col.replace("'", "")
+
+        # avoid leading numbers
+        col = re.sub(r"^(\d+)([A-Z]+)(\.\d+)?$", r"\2\1\3", col)  # 例：20GP.1 → GP20.1
+
+        new_columns.append(col)
+
+    df.columns = new_columns
+    return df
+
+COLUMN_RENAMES = {
+    'CARRIER': 'Carrier',
+    'DESTINATION': 'Destination',
+    'T_T': 'T_T_TO_POD',
+    'EFFECTIVE_DATE': 'Effective_Date',
+    'EXPIRY_DATE': 'Expiring_Date'
+}
+
+def standardize_columns(df):
+    """ Clean the header names, unify the remark column and rename the common fields """
+    df = clean_column_names(df)
+    df = unify_remark_column_name(df)
+    df = df.rename(columns=COLUMN_RENAMES)
+    return df.loc[:, ~df.columns.duplicated()]
+
+
+# ---------------------------
+# Value Matching
+# ---------------------------
+
+# fuzzy matches must score above this to replace the raw value
+MATCH_THRESHOLD = 75
+
+def _best_matches(queries, choices):
+    """ Score every query against every choice in one cdist call, returns [(best choice index, score)] """
+    scores = process.cdist(queries, choices, scorer=fuzz.WRatio, dtype=np.float64)
+    best = scores.argmax(axis=1)
+    return [(idx, scores[i, idx]) for i, idx in enumerate(best)]
+
+
+# ---------------------------
+# Normalization Cache
+# ---------------------------
+
+# the reference data each kind of mapping depends on, editing a table invalidates its cached rows
+CACHE_FINGERPRINTS = {
+    "POL": table_fingerprint(port_aliases, MATCH_THRESHOLD),
+    "Carrier": table_fingerprint(carrier_aliases, MATCH_THRESHOLD),
+    "Destination": table_fingerprint(city_mapping_keywords, MATCH_THRESHOLD),
+}
+
+normalization_cache = None
+cache_counters = {kind: {"hits": 0, "misses": 0} for kind in CACHE_FINGERPRINTS}
+
+def use_normalization_cache(path):
+    """ Keep raw → canonical mappings in the SQLite file at `path` across runs, None switches the cache off """
+    global normalization_cache
+    normalization_cache = NormalizationCache(path) if path else None
+
+def _cached_resolve(kind, values, resolve_values):
+    if normalization_cache is None:
+        return resolve_values(values)
+
+    fingerprint = CACHE_FINGERPRINTS[kind]
+    resolved = normalization_cache.lookup(kind, fingerprint, [v for v in values if isinstance(v, str)])
+    missing = [v for v in values if not (isinstance(v, str) and v in resolved)]
+    cache_counters[kind]["hits"] += len(values) - len(missing)
+    cache_counters[kind]["misses"] += len(missing)
+
+    # only the misses go through the alias / rapidfuzz matching
+    if missing:
+        fresh = resolve_values(missing)
+        normalization_cache.store(kind, fingerprint, {
+            raw: canonical for raw, canonical in fresh.items() if isinstance(raw, str) and isinstance(canonical, str)
+        })
+        resolved.update(fresh)
+    return resolved
+
+def _resolve_column(col, kind, resolve_values):
+    # each distinct value is resolved only once, then mapped back onto the column
+    mapping = _cached_resolve(kind, col.dropna().unique(), resolve_values)
+    return col.map(mapping).where(col.notna(), col)
+
+
+# ---------------------------
+# POL / Carrier / Destination
+# ---------------------------
+
+# compiled once, finds every alias hit in one pass; the earliest port in port_aliases wins
+# overlapping codes (e.g. "ZJG" → ZHENJIANG, JIANGSU), see alias_matcher.py
+port_alias_matcher = AliasMatcher.from_mapping(port_aliases)
+
+def _match_pol_alias(pol):
+    return port_alias_matcher.best(pol)
+
+def resolve_pol_values(values):
+    """ Resolve distinct raw POL strings to full port names, returns {raw value: port name} """
+    port_list = list(port_aliases.keys())
+    resolved = {}
+    pending = {}  # upper-cased POL -> raw values still waiting for the fuzzy pass
+
+    for raw in values:
+        if pd.isna(raw) or str(raw).strip() == "":
+            resolved[raw] = raw
+            continue
+        pol = str(raw).upper().strip()
+        full_name = _match_pol_alias(pol)
+        if full_name:
+            resolved[raw] = full_name
+        else:
+            pending.setdefault(pol, []).append(raw)
+
+    # `fuzzy match` every leftover value against the port list in one call
+    if pending:
+        queries = list(pending)
+        for pol, (idx, score) in zip(queries, _best_matches(queries, port_list)):
+            match = port_list[idx] if score > MATCH_THRESHOLD else pol
+            for raw in pending[pol]:
+                resolved[raw] = match
+    return resolved
+
+def resolve_pol_column(col):
+    """ Batched fuzzy_match_pol over a whole column """
+    return _resolve_column(col, "POL", resolve_pol_values)
+
+def fuzzy_match_pol(pol):
+    if pd.isna(pol) or pol.strip() == "":
+        return pol
+    return resolve_pol_values([pol])[pol]
+
+# SCAC code / alias → standard carrier name, the first carrier listed wins a shared alias
+carrier_index = {}
+for standard, aliases in carrier_aliases.items():
+    for alias in aliases:
+        carrier_index.setdefault(alias, standard)
+
+def resolve_carrier_values(values):
+    """ Resolve distinct raw carrier names / SCAC codes to standard carrier names, returns {raw value: carrier} """
+    standard_names = list(carrier_aliases.keys())
+    resolved = {}
+    pending = {}  # upper-cased carrier -> raw values still waiting for the fuzzy pass
+
+    for raw in values:
+        if pd.isna(raw) or str(raw).strip() == "":
+            resolved[raw] = raw
+            continue
+        val = str(raw).strip().upper()
+
+        # match against standard names directly
+        standard = carrier_index.get(val)
+        if standard:
+            resolved[raw] = standard
+        else:
+            pending.setdefault(val, []).append(raw)
+
+    # fuzzy match
+    if pending:
+        queries = list(pending)
+        for val, (idx, score) in zip(queries, _best_matches(queries, standard_names)):
+            match = standard_names[idx] if score > MATCH_THRESHOLD else val
+            for raw in pending[val]:
+                resolved[raw] = match
+    return resolved
+
+def resolve_carrier_column(col):
+    """ Batched fuzzy_match_carrier over a whole column """
+    return _resolve_column(col, "Carrier", resolve_carrier_values)
+
+def fuzzy_match_carrier(val):
+    if pd.isna(val) or str(val).strip() == "":
+        return val
+    return resolve_carrier_values([val])[val]
+
+def build_city_index(keywords):
+    """ {alias token: standard city} from the comma-joined keyword strings, the first city listed wins a shared token """
+    index = {}
+    for standard, aliases in keywords.items():
+        for token in [standard.split(",")[0]] + aliases.split(","):
+            token = token.strip().upper()
+            if token:
+                index.setdefault(token, standard)
+    return index
+
+# parsed once: "LOS ANGELES, LAX, LGB, ..." → {"LOS ANGELES": "LAX/LGB", "LAX": "LAX/LGB", ...}
+city_index = build_city_index(city_mapping_keywords)
+
+def resolve_city_values(values):
+    """ Resolve distinct raw destinations to standard city names, returns {raw value: city} """
+    alias_list = list(city_index)
+    resolved = {}
+    pending = {}  # city part -> [(raw value, upper-cased value)] still waiting for the fuzzy pass
+
+    for raw in values:
+        if pd.isna(raw) or str(raw).strip() == "":
+            resolved[raw] = raw
+            continue
+        val = str(raw).strip().upper()
+        val_city = re.split(r"[,-]", val)[0].strip()
+
+        # exact alias token lookup
+        standard = city_index.get(val_city)
+        if standard:
+            resolved[raw] = standard
+        else:
+            pending.setdefault(val_city, []).append((raw, val))
+
+    # fuzzy match the leftover city parts against the alias tokens in one call
+    if pending:
+        queries = list(pending)
+        for val_city, (idx, score) in zip(queries, _best_matches(queries, alias_list)):
+            for raw, val in pending[val_city]:
+                resolved[raw] = city_index[alias_list[idx]] if score > MATCH_THRESHOLD else val
+    return resolved
+
+def resolve_city_column(col):
+    """ Batched fuzzy_match_city over a whole column """
+    return _resolve_column(col, "Destination", resolve_city_values)
+
+def fuzzy_match_city(val):
+    if pd.isna(val) or str(val).strip() == "":
+        return val
+    return resolve_city_values([val])[val]
+
+
+# ---------------------------
+# Dates & Formulas
+# ---------------------------
+
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d", "%d-%b-%Y", "%Y.%m.%d"]
+NA_MARKERS = ["", "NIL", "-", "—"]
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+EXCEL_MAX_SERIAL = 2958465  # 9999-12-31
+
+def _fix_year(dates, mask, expected_year):
+    """ Move the dates selected by `mask` that are more than a year away from the file's year into that year """
+    off = mask & dates.notna() & ((dates.dt.year < expected_year - 1) | (dates.dt.year > expected_year + 1))
+    if off.any():
+        parts = pd.DataFrame({"year": expected_year, "month": dates[off].dt.month, "day": dates[off].dt.day})
+        dates[off] = pd.to_datetime(parts, errors="coerce")
+    return dates
+
+def _text_values(col):
+    # stripped strings, NA for every cell that is not text
+    try:
+        text = col.str.strip()
+    except AttributeError:
+        text = None
+    if text is None or not (text.dtype == object or pd.api.types.is_string_dtype(text)):
+        return pd.Series(pd.NA, index=col.index, dtype=object)
+    return text
+
+def parse_date_column(col, expected_year):
+    """
+    Parse one column to datetimes with whole-column passes, each pass only touching the rows still unparsed:
+    Excel serial numbers, native datetimes, then every DATE_FORMATS entry, then pandas' own inference.
+    Returns (datetime series, {pass: rows parsed}).
+    """
+    dates = pd.Series(pd.NaT, index=col.index, dtype="datetime64[ns]")
+    hits = {}
+
+    # Excel serial numbers (numeric cells or numeric strings), plain array math
+    numbers = col if pd.api.types.is_numeric_dtype(col) else pd.to_numeric(col, errors="coerce")
+    serial = numbers.notna() & (numbers >= 1) & (numbers <= EXCEL_MAX_SERIAL)
+    if serial.any():
+        dates[serial] = EXCEL_EPOCH + pd.to_timedelta(numbers[serial], unit="D")
+        dates = _fix_year(dates, serial, expected_year)
+        hits["excel serial"] = int(serial.sum())
+    if pd.api.types.is_numeric_dtype(col):
+        return dates, hits
+
+    # cells Excel already stored as dates
+    text = _text_values(col)
+    native = col.notna() & text.isna() & ~serial
+    if native.any():
+        dates[native] = pd.to_datetime(col[native], errors="coerce")
+        hits["datetime"] = int(dates[native].notna().sum())
+
+    # text dates, one vectorized pass per known format
+    todo = text.notna() & ~serial & ~text.str.upper().isin(NA_MARKERS)
+    for fmt in DATE_FORMATS:
+        if not todo.any():
+            break
+        parsed = pd.to_datetime(text[todo], format=fmt, errors="coerce")
+        ok = parsed.notna()
+        if ok.any():
+            dates[ok[ok].index] = parsed[ok]
+            dates = _fix_year(dates, ok.reindex(dates.index, fill_value=False), expected_year)
+            hits[fmt] = int(ok.sum())
+        todo &= dates.isna()
+
+    # anything left gets pandas' per-element inference
+    if todo.any():
+        parsed = pd.to_datetime(text[todo], format="mixed", errors="coerce")
+        dates[todo] = parsed
+        hits["inferred"] = int(parsed.notna().sum())
+    return dates, hits
+
+def standardize_date_columns(df, filename, date_hits=None):
+    year_match = re.search(r'202[0-9]{1}', filename)
+    expected_year = int(year_match.group()) if year_match else 2025
+    for col in df.columns:
+        if "date" in col.lower():
+            print(f"Column {col}, Type: {df[col].dtype}")
+            print(f"Old3: {df[col].head(3).tolist()}")
+            dates, hits = parse_date_column(df[col], expected_year)
+            unparsed = int((df[col].notna() & dates.isna()).sum())
+            print(f"📅 {col}: " + ", ".join(f"{fmt} {n}" for fmt, n in hits.items()) + f", unparsed {unparsed}")
+            if date_hits is not None:
+                for fmt, n in hits.items():
+                    date_hits[fmt] = date_hits.get(fmt, 0) + n
+            df[col] = dates.dt.strftime("%Y-%m-%d")
+            print(f"Cleaned3: {df[col].head(3).tolist()}")
+    return df
+
+def _sheet_formula_values(ws, chunk_size):
+    rows = ws.iter_rows(values_only=True)
+
+    # detect the header on the first rows only, the rest of the sheet is streamed
+    head = []
+    for row in rows:
+        head.append(row)
+        if len(head) == 10:
+            break
+    if not head:
+        return pd.DataFrame()
+    header_row = detect_header_row(pd.DataFrame(head))
+    header = [col if col is not None else f"Unnamed: {i}" for i, col in enumerate(head[header_row])]
+    width = len(header)
+
+    def fit(row):
+        # read-only rows can be ragged, pad / cut them to the header width
+        row = tuple(row[:width])
+        return row + (None,) * (width - len(row))
+
+    chunks = []
+    chunk = [fit(row) for row in head[header_row + 1:]]
+    for row in rows:
+        chunk.append(fit(row))
+        if len(chunk) >= chunk_size:
+            chunks.append(pd.DataFrame(chunk, columns=header))
+            chunk = []
+    if chunk or not chunks:
+        chunks.append(pd.DataFrame(chunk, columns=header))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+def extract_formula_values(filepath, sheet_name=None, all_sheets=False, chunk_size=50000):
+    """
+    Computed values (not formulas) of a workbook, streamed through openpyxl's read-only mode
+    and turned into a DataFrame `chunk_size` rows at a time, with the header row detected per sheet.
+    Reads the active sheet, `sheet_name`, or every sheet as {title: DataFrame} with all_sheets=True.
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        if all_sheets:
+            return {ws.title: _sheet_formula_values(ws, chunk_size) for ws in wb.worksheets}
+        ws = wb[sheet_name] if sheet_name is not None else wb.active
+        return _sheet_formula_values(ws, chunk_size)
+    finally:
+        wb.close()
+
+
+# ---------------------------
+# Rate Values
+# ---------------------------
+# Agents write rates as 1250, "1,250", "USD 1,250.00", "$1250", "1250+BAF" or "AT COST".
+# Every rate column becomes float64. Cells without a plain amount (text after it, "AT COST",
+# true / false) are left empty and listed in the quarantine table with the reason and the
+# leading amount, so a person can check them without the row being dropped and a partial
+# number such as 1.25 from "1.250,00" is never ranked as a price.
+
+RATE_COLUMNS = ["GP20", "GP40", "HQ40", "HQ45"]
+CURRENCY = r"(?:USD|US\$|US|\$)"
+RATE_PATTERN = rf"^{CURRENCY}?\s*(-?\d+(?:\.\d+)?)\s*{CURRENCY}?\s*(.*)$"
+THOUSANDS_SEPARATOR = r"(?<=\d)[,\s](?=\d{3}(?!\d))"
+QUARANTINE_COLUMNS = ["source_file", "row", "column", "raw_value", "parsed_value", "reason"]
+
+def parse_rate_column(col):
+    """
+    (float64 amounts, reasons, leading amounts) for one rate column. Reasons are NA for clean and
+    empty cells; quarantined cells have no amount, only the leading number found in them.
+    """
+    if pd.api.types.is_bool_dtype(col):
+        booleans = col.notna()
+    else:
+        # isin() also finds 1 and 0 (1 == True), their text tells the booleans apart
+        booleans = col.isin([True, False])
+        booleans[booleans] = col[booleans].astype(str).isin(["True", "False"]).to_numpy()
+    values = pd.to_numeric(col.mask(booleans), errors="coerce").astype("float64")
+    reasons = pd.Series(pd.NA, index=col.index, dtype=object)
+    leading = pd.Series(np.nan, index=col.index, dtype="float64")
+    reasons[booleans] = "not a number: boolean"
+
+    text = _text_values(col)
+    text = text[values.isna() & text.notna()].str.upper()
+    text = text[~text.isin(NA_MARKERS)]
+    if text.empty:
+        return values, reasons, leading
+
+    parts = text.str.replace(THOUSANDS_SEPARATOR, "", regex=True).str.extract(RATE_PATTERN)
+    amounts = pd.to_numeric(parts[0], errors="coerce")
+    extra = parts[1].fillna("").str.strip()
+    leading[amounts.index] = amounts
+    clean = amounts.notna() & (extra == "")
+    values[clean[clean].index] = amounts[clean]
+    missing = amounts.isna()
+    reasons[missing[missing].index] = "no amount"
+    with_extra = amounts.notna() & (extra != "")
+    reasons[with_extra[with_extra].index] = "text after amount: " + extra[with_extra]
+    return values, reasons, leading
+
+def coerce_rate_columns(df, source_file):
+    """ Turn every RATE_COLUMNS column of `df` into float64, returns (df, quarantine rows) """
+    quarantined = []
+    for col in RATE_COLUMNS:
+        if col not in df.columns:
+            continue
+        values, reasons, leading = parse_rate_column(df[col])
+        flagged = reasons.notna()
+        if flagged.any():
+            quarantined.append(pd.DataFrame({
+                "source_file": os.path.basename(source_file),
+                "row": df.index[flagged],
+                "column": col,
+                "raw_value": df.loc[flagged, col].astype(str).to_numpy(),
+                "parsed_value": leading[flagged].to_numpy(),
+                "reason": reasons[flagged].to_numpy(),
+            }))
+        df[col] = values
+    quarantine = pd.concat(quarantined, ignore_index=True) if quarantined else pd.DataFrame(columns=QUARANTINE_COLUMNS)
+    return df, quarantine
+
+
+# ---------------------------
+# Cleaned Output
+# ---------------------------
+
+# the columns uploaded to BigQuery, in order
+UPLOAD_COLUMNS = [
+    'POL', 'Carrier', 'T_T_TO_POD', 'Destination',
+    'Effective_Date', 'Expiring_Date',
+    'GP20', 'GP40', 'HQ40', 'HQ45',
+    'COMM', 'COMM_DETAILS',
+    'COMMODITY', 'remark'
+]
+
+ARROW_OBJECT_KINDS = {"string", "empty", "integer", "floating", "mixed-integer-float", "boolean", "datetime", "date", "decimal"}
+
+def _arrow_safe(df):
+    # Arrow needs one type per column, object columns mixing numbers and text are stored as text
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ARROW_OBJECT_KINDS:
+            df[col] = df[col].astype(str).where(df[col].notna())
+    return df
+
+def write_cleaned_frame(df, path, excel_export=False):
+    """ Write a cleaned frame as Parquet, the handoff to the upload step, plus an .xlsx copy for people if asked """
+    df = df.copy(deep=False)
+    df.columns = [str(col) for col in df.columns]
+    df = _arrow_safe(df)
+    df.to_parquet(path, index=False)
+    if excel_export:
+        df.to_excel(os.path.splitext(str(path))[0] + ".xlsx", index=False)
+    return df
+
+def replace_na_markers(df):
+    """ Turn the "", NIL, -, — placeholders of non-date columns into NA """
+    for col in df.columns:
+        if "date" in col.lower():
+            continue
+        marker = _text_values(df[col]).str.upper().isin(NA_MARKERS)
+        if marker.any():
+            df[col] = df[col].mask(marker, pd.NA)
+    return df
+
+def load_upload_frame(path):
+    """
+    The UPLOAD_COLUMNS of a cleaned Parquet file, with the NA placeholders replaced, typed for the
+    fixed upload schema: every column present, rates float64, dates as dates, the rest text.
+    """
+    import pyarrow.parquet as pq
+    names = pq.read_schema(path).names
+    df = pd.read_parquet(path, columns=[col for col in UPLOAD_COLUMNS if col in names])
+    df = replace_na_markers(df).reindex(columns=UPLOAD_COLUMNS)
+    for col in UPLOAD_COLUMNS:
+        if col in RATE_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        elif col in ("Effective_Date", "Expiring_Date"):
+            dates = pd.to_datetime(df[col], errors="coerce").dt.date
+            df[col] = dates.astype(object).where(dates.notna(), None)
+        else:
+            df[col] = df[col].astype("string")
+    return df
+
+
+# ---------------------------
+# Cleaning Chain
+# ---------------------------
+
+# bump when the cleaning logic changes, so the manifest sends every workbook through the chain again
+PIPELINE_VERSION = "3"
+
+def pipeline_version():
+    """ PIPELINE_VERSION plus the reference tables, editing an alias table also counts as a new version """
+    return table_fingerprint(PIPELINE_VERSION, CACHE_FINGERPRINTS)[:16]
+
+def _clean_column(df, col, resolve_column, path):
+    if col in df.columns:
+        print(f"\n📄 file: {path}")
+        print("🔍 old:", df[col].dropna().unique()[:10])
+        df[col] = resolve_column(df[col])
+        print("✅ cleaned:", df[col].dropna().unique()[:10])
+    return df
+
+def clean_rate_sheet(path):
+    """ Run one workbook through the whole cleaning chain, returns (cleaned df, read / cache stats and quarantine rows) """
+    for counters in cache_counters.values():
+        counters.update(hits=0, misses=0)
+
+    df, stats = read_rate_sheet(path)
+    df = standardize_columns(df)
+    print(f"📄 {path} Cleaned Head Row Name:", df.columns.tolist())
+
+    if "POL" not in df.columns:
+        print(f"⚠️ file has no POL columns: {path}")
+    df = _clean_column(df, "POL", resolve_pol_column, path)
+
+    print(f"\n⏳ Cleaned Date: {path}")
+    stats["dates"] = {}
+    df = standardize_date_columns(df, path, date_hits=stats["dates"])
+
+    df = _clean_column(df, "Carrier", resolve_carrier_column, path)
+    df = _clean_column(df, "Destination", resolve_city_column, path)
+
+    df, stats["quarantine"] = coerce_rate_columns(df, path)
+    if len(stats["quarantine"]):
+        print(f"🧪 {len(stats['quarantine'])} rate cells quarantined: {path}")
+
+    stats["cache"] = {kind: dict(counters) for kind, counters in cache_counters.items()}
+    return df, stats
+
+def _safe_clean_rate_sheet(path):
+    # errors are returned instead of raised, so one bad sheet cannot stop the batch
+    try:
+        return path, clean_rate_sheet(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+def _pool_context():
+    # workers are forked so they inherit the loaded modules and never re-run the notebook script
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+def clean_rate_sheets(paths, workers=1):
+    """
+    Clean every workbook in `paths`, in a process pool when workers > 1.
+    Returns (dfs, read_stats, errors), each keyed by path in the order of `paths`.
+    """
+    paths = list(paths)
+    ctx = _pool_context()
+    if workers > 1 and ctx is None:
+        print("⚠️ process pool needs the 'fork' start method, cleaning files one at a time")
+        workers = 1
+
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=ctx) as pool:
+            outcomes = list(pool.map(_safe_clean_rate_sheet, paths))
+    else:
+        outcomes = [_safe_clean_rate_sheet(path) for path in paths]
+
+    dfs, read_stats, errors = {}, {}, {}
+    for path, result, error in outcomes:
+        if error is not None:
+            print(f"❌ failed to clean {os.path.basename(path)}: {error}")
+            errors[path] = error
+            continue
+        dfs[path], read_stats[path] = result
+    return dfs, read_stats, errors
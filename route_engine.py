@@ -0,0 +1,229 @@
+"""
+Route lookups behind the rate sheet page.
+
+Plain pandas with no Streamlit or BigQuery calls, so streamlit_app.py can cache the
+results per dataset version and the same code can be timed outside the app.
+"""
+import numpy as np
+import pandas as pd
+
+ROUTE_KEYS = ["POL", "Destination", "Carrier"]
+
+
+# low-cardinality text columns held as categoricals, one category set per column across all tables
+DICTIONARY_COLUMNS = ROUTE_KEYS + ["T_T_TO_POD", "COMM", "COMM_DETAILS", "COMMODITY", "remark"]
+RATE_VALUE_COLUMNS = ["GP20", "GP40", "HQ40", "HQ45"]
+# what identifies a rate row whichever index it was loaded into, see row_keys()
+ROW_KEY_COLUMNS = ["Source table"] + DICTIONARY_COLUMNS + RATE_VALUE_COLUMNS + ["Effective_Date", "Expiring_Date"]
+
+
+def _factorize(col, normalize):
+    """ (codes, labels) of a column, NA as code -1; route keys are normalized on the labels only """
+    codes, uniques = pd.factorize(col, use_na_sentinel=True)
+    labels = pd.Index(uniques, dtype=object).astype(str)
+    if normalize:
+        labels = labels.str.strip().str.upper()
+    return codes.astype(_code_dtype(len(labels))), labels
+
+
+def _code_dtype(n_categories):
+    # the smallest signed integer holding every code and -1, as pandas stores categorical codes
+    return np.min_scalar_type(-n_categories - 1)
+
+
+def _hash_column(col):
+    return pd.util.hash_pandas_object(col, index=False).to_numpy()
+
+
+def row_keys(df):
+    """
+    Stable int64 identity of every row from its source table and values: the same rate row gets the
+    same key in every index built over the same dataset version, whatever else was loaded with it.
+    Columns are hashed one at a time into one accumulator (pandas' combine_hash_arrays), a missing
+    column as the one hash of its NA, so no key frame is materialized.
+    """
+    out = np.full(len(df), 0x345678, dtype=np.uint64)
+    mult = np.uint64(1000003)
+    for i, col in enumerate(ROW_KEY_COLUMNS):
+        if col in df.columns:
+            hashed = _hash_column(df[col])
+        else:
+            hashed = _hash_column(pd.Series([np.nan] if col in RATE_VALUE_COLUMNS else [None]))[0]
+        out ^= hashed
+        out *= mult
+        mult += np.uint64(82520 + 2 * (len(ROW_KEY_COLUMNS) - i))
+    out += np.uint64(97531)
+    return out.view("int64")
+
+
+def _concat_column(parts, lengths):
+    # one column of the index from its per-table parts, None for a table without the column
+    dtype = next(part.dtype for part in parts if part is not None)
+    return pd.concat([part if part is not None else pd.Series(None, index=range(length), dtype=dtype)
+                      for part, length in zip(parts, lengths)], ignore_index=True)
+
+
+def build_route_index(tables):
+    """
+    One frame over every rate table in {table name: frame}, with normalized POL / Destination /
+    Carrier, a "Source table", a "Row id" (position) and a "Row key" (see row_keys()) column.
+    Tables missing any of the route columns are skipped.
+    Text columns are categoricals sharing one category set across tables, rate columns are float64.
+    The index is assembled column by column: the category codes of every table are written straight
+    into one array per column instead of building per-table frames and concatenating them, so the
+    build peaks close to the size of the finished index.
+    """
+    tables = {table: df for table, df in tables.items() if set(ROUTE_KEYS).issubset(df.columns)}
+    if not tables:
+        return pd.DataFrame(columns=ROUTE_KEYS + ["Source table", "Row id", "Row key"])
+
+    factorized = {table: {col: _factorize(df[col], col in ROUTE_KEYS) for col in DICTIONARY_COLUMNS if col in df.columns}
+                  for table, df in tables.items()}
+    lengths = [len(df) for df in tables.values()]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    columns = {}
+    for col in dict.fromkeys(col for df in tables.values() for col in df.columns):
+        if col in DICTIONARY_COLUMNS:
+            labels = [parts[col][1] for parts in factorized.values() if col in parts]
+            dtype = pd.CategoricalDtype(labels[0].append(labels[1:]).unique().sort_values())
+            codes = np.full(bounds[-1], -1, dtype=_code_dtype(len(dtype.categories)))
+            for start, parts in zip(bounds, factorized.values()):
+                if col in parts:
+                    table_codes, table_labels = parts.pop(col)
+                    # code -1 (NA) picks the trailing -1, an all-NA column has no labels at all
+                    mapped = np.append(dtype.categories.get_indexer(table_labels), -1).astype(codes.dtype)
+                    codes[start:start + len(table_codes)] = mapped[table_codes]
+            columns[col] = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+        elif col in RATE_VALUE_COLUMNS:
+            values = np.full(bounds[-1], np.nan)
+            for start, df in zip(bounds, tables.values()):
+                if col in df.columns:
+                    values[start:start + len(df)] = pd.to_numeric(df[col], errors="coerce").to_numpy("float64", na_value=np.nan)
+            columns[col] = values
+        else:
+            columns[col] = _concat_column([df[col] if col in df.columns else None for df in tables.values()], lengths)
+    source_codes = np.repeat(np.arange(len(tables), dtype=_code_dtype(len(tables))), lengths)
+    columns["Source table"] = pd.Categorical.from_codes(source_codes, dtype=pd.CategoricalDtype(list(tables)), validate=False)
+
+    index = pd.DataFrame(columns, copy=False)
+    index["Row id"] = np.arange(len(index))  # position in the index, survives the merge in match_routes()
+    index["Row key"] = row_keys(index)  # the row across indexes, for choices kept between reruns
+    return index
+
+
+def match_routes(index, routes):
+    """
+    Rows of the route index for every (origin, destination, carrier) in `routes`, in one merge.
+    Returns (matched rows in route order, routes with no row in any table).
+    """
+    wanted = pd.DataFrame(routes, columns=ROUTE_KEYS).drop_duplicates()
+    # join on category codes; a value missing from the categories cannot match anything
+    for col in ROUTE_KEYS:
+        known = wanted[col].isin(index[col].cat.categories)
+        wanted[col] = pd.Categorical(wanted[col].where(known), dtype=index[col].dtype)
+    wanted = wanted.dropna()
+    matched = wanted.merge(index, on=ROUTE_KEYS, how="inner")
+    matched = matched[list(index.columns)]
+    found = set(matched[ROUTE_KEYS].drop_duplicates().itertuples(index=False, name=None))
+    unmatched = [route for route in routes if tuple(route) not in found]
+    return matched, unmatched
+
+
+def route_value_sets(index):
+    """ {table: {route column: set of values}}, computed once so route misses are explained by set lookups """
+    value_sets = {}
+    for table, group in index.groupby("Source table", sort=False, observed=True):
+        value_sets[table] = {col: set(group[col].unique()) for col in ROUTE_KEYS}
+    return value_sets
+
+
+def explain_unmatched(value_sets, routes):
+    """ One row per unmatched route with the "Cannot find ..." reasons collected over every table """
+    rows = []
+    for origin, destination, carrier in routes:
+        reasons = set()
+        for values in value_sets.values():
+            if origin not in values["POL"]: reasons.add(f"Cannot find POL: {origin}")
+            if destination not in values["Destination"]: reasons.add(f"Cannot find Destination: {destination}")
+            if carrier not in values["Carrier"]: reasons.add(f"Cannot find Carrier: {carrier}")
+        if not reasons:
+            reasons.add("No table has this POL, Destination and Carrier together")
+        rows.append((origin, destination, carrier, "，".join(sorted(reasons))))
+    return pd.DataFrame(rows, columns=ROUTE_KEYS + ["Reason"])
+
+
+ROUTE_GROUP = ["POL", "Destination"]
+EXCLUDED = -1  # pick for a carrier left out of the selection
+
+
+def _sort_values(df, sort_key):
+    return pd.to_numeric(df[sort_key], errors="coerce") if sort_key in df.columns else pd.Series(float("nan"), index=df.index)
+
+
+def rank_rates(df, sort_key="GP20"):
+    """
+    Rows sorted by route and `sort_key` (missing prices last) with a "Carrier rank" column,
+    1 for the cheapest row of each carrier on each route.
+    """
+    ranked = df.assign(_sort=_sort_values(df, sort_key))
+    ranked = ranked.sort_values(ROUTE_GROUP + ["_sort"], kind="stable", na_position="last")
+    ranked["Carrier rank"] = ranked.groupby(ROUTE_GROUP + ["Carrier"], sort=False, observed=True).cumcount() + 1
+    return ranked.drop(columns="_sort")
+
+
+def _pick_overrides(df, picks):
+    # the pick of every row's route and carrier, NaN where there is none
+    keys = pd.MultiIndex.from_frame(df[ROUTE_GROUP + ["Carrier"]].astype(object))
+    chosen = pd.Series(list(picks.values()), index=pd.MultiIndex.from_tuples(list(picks)), dtype=object)
+    return chosen[~chosen.index.duplicated(keep="last")].reindex(keys).to_numpy()
+
+
+def stale_picks(df, picks):
+    """ Keys of `picks` whose route and carrier still has rows in `df`, none of them the picked Row key """
+    if not picks:
+        return []
+    override = _pick_overrides(df, picks)
+    hit = df["Row key"].to_numpy() == override
+    routes = pd.MultiIndex.from_frame(df[ROUTE_GROUP + ["Carrier"]].astype(object))
+    present = set(routes)
+    resolved = set(routes[hit])
+    return [key for key, pick in picks.items() if pick != EXCLUDED and key in present and key not in resolved]
+
+
+def select_rates(ranked, sort_key="GP20", top_n=5, picks=None):
+    """
+    One row per route and carrier from rank_rates() output, the cheapest unless `picks`
+    {(pol, destination, carrier): Row key of the chosen row, or EXCLUDED} overrides it, then the
+    `top_n` cheapest of those per route. A pick whose row is no longer in `ranked` (filtered out
+    by a keyword search, say) falls back to the cheapest row.
+    """
+    chosen = (ranked["Carrier rank"] == 1).to_numpy()
+    if picks:
+        override = _pick_overrides(ranked, picks)
+        hit = ranked["Row key"].to_numpy() == override
+        group = ranked.groupby(ROUTE_GROUP + ["Carrier"], sort=False, observed=True).ngroup().to_numpy()
+        # identical rows share a key, the first of them stands for the pick
+        hit &= pd.Series(hit).groupby(group).cumsum().to_numpy() == 1
+        pick_found = pd.Series(hit).groupby(group).transform("any").to_numpy()
+        chosen = np.where(pick_found, hit, chosen)
+        chosen &= override != EXCLUDED
+    selected = ranked[chosen]
+    selected = selected.assign(_sort=_sort_values(selected, sort_key))
+    selected = selected.sort_values(ROUTE_GROUP + ["_sort"], kind="stable", na_position="last")
+    selected = selected[selected.groupby(ROUTE_GROUP, sort=False, observed=True).cumcount() < top_n]
+    return selected.drop(columns="_sort")
+
+
+def _label_part(df, col):
+    return df[col].astype("string").fillna("Null") if col in df.columns else pd.Series("Null", index=df.index, dtype="string")
+
+
+def option_labels(df):
+    """ Radio label of every row, built column-wise instead of one .iloc lookup per label field """
+    return (
+        "20' " + _label_part(df, "GP20") + "$ ｜ "
+        + "40' " + _label_part(df, "GP40") + "$ ｜ "
+        + "Remark: " + _label_part(df, "remark") + " ｜ "
+        + "COMM: " + _label_part(df, "COMM") + " ｜ "
+        + "COMM_DETAILS: " + _label_part(df, "COMM_DETAILS")
+    )
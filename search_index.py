@@ -0,0 +1,90 @@
+"""
+Keyword search over the free-text columns of the rate data (remark, COMM, COMM_DETAILS).
+
+The text of each row is lowercased once and factorized: rates repeat the same few
+remarks thousands of times, so every search runs on the distinct texts only and is
+mapped back to rows with one array lookup. A token -> distinct text inverted index
+answers plain keywords from the vocabulary, phrases are checked only on the texts
+holding all of their tokens, and /regex/ terms run on the distinct texts.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+SEARCH_COLUMNS = ["remark", "COMM", "COMM_DETAILS"]
+TOKEN = re.compile(r"\w+")
+# /regex/, "quoted phrase" or a bare keyword; commas and semicolons separate terms too
+QUERY_TERM = re.compile(r'/((?:[^/\\]|\\.)+)/|"([^"]+)"|([^\s,;"]+)')
+
+
+def parse_query(query):
+    """ [(kind, value)] with kind "regex", "phrase" or "keyword", values lowercased except regex """
+    terms = []
+    for regex, phrase, keyword in QUERY_TERM.findall(query or ""):
+        if regex:
+            terms.append(("regex", regex))
+        elif phrase.strip():
+            terms.append(("phrase", phrase.strip().lower()))
+        elif keyword:
+            terms.append(("keyword", keyword.lower()))
+    return terms
+
+
+class SearchIndex:
+    def __init__(self, df, columns=SEARCH_COLUMNS):
+        present = [col for col in columns if col in df.columns]
+        text = pd.Series("", index=df.index, dtype=object)
+        for col in present:
+            values = df[col].astype("string").fillna("").str.lower().astype(object)
+            text = text + " | " + values if col != present[0] else values
+        self.codes, uniques = pd.factorize(text)
+        self.texts = np.asarray(uniques, dtype=object)
+        self.postings = self._build_postings(self.texts)
+
+    @staticmethod
+    def _build_postings(texts):
+        tokens = pd.Series(texts).str.findall(TOKEN).explode().dropna()
+        return {token: np.unique(ids) for token, ids in tokens.index.groupby(tokens.to_numpy()).items()}
+
+    def _token_hits(self, fragment):
+        """ Distinct texts with a token containing `fragment`, from the vocabulary instead of the rows """
+        ids = [ids for token, ids in self.postings.items() if fragment in token]
+        return np.unique(np.concatenate(ids)) if ids else np.array([], dtype=int)
+
+    def _term_hits(self, kind, value):
+        if kind == "regex":
+            try:
+                pattern = re.compile(value, re.IGNORECASE)
+            except re.error as exc:
+                raise ValueError(f"invalid regex /{value}/: {exc}") from exc
+            return np.flatnonzero([bool(pattern.search(text)) for text in self.texts])
+        tokens = TOKEN.findall(value)
+        if kind == "keyword" and len(tokens) == 1 and tokens[0] == value:
+            return self._token_hits(value)
+        # phrases (and keywords with punctuation): texts with every token, then a substring check
+        candidates = None
+        for token in tokens:
+            hits = self._token_hits(token)
+            candidates = hits if candidates is None else np.intersect1d(candidates, hits, assume_unique=True)
+        if candidates is None:
+            candidates = np.arange(len(self.texts))
+        return np.array([i for i in candidates if value in self.texts[i]], dtype=int)
+
+    def mask(self, query, how="any"):
+        """
+        Boolean array over the indexed rows: rows matching any (or, with how="all", every)
+        term of `query`. An empty query matches nothing.
+        """
+        terms = parse_query(query)
+        if not terms:
+            return np.zeros(len(self.codes), dtype=bool)
+        matched = None
+        for kind, value in terms:
+            hit = np.zeros(len(self.texts), dtype=bool)
+            hit[self._term_hits(kind, value)] = True
+            if matched is None:
+                matched = hit
+            else:
+                matched = matched | hit if how == "any" else matched & hit
+        return matched[self.codes]
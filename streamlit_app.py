@@ -3,6 +3,7 @@ import json
 from functools import lru_cache
 from typing import Optional, Dict
 from itertools import product
+from datetime import date
 
 import streamlit as st
 import numpy as np
@@ -10,6 +11,14 @@ import pandas as pd
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
+from pricing import fee_rules, load_fee_rules, price_routes
+from route_engine import (ROUTE_KEYS, ROUTE_GROUP, build_route_index, match_routes, route_value_sets,
+                          explain_unmatched, rank_rates, select_rates, stale_picks, option_labels, EXCLUDED)
+from search_index import SearchIndex
+from rate_storage import RateStorage, open_storage
+from bigquery_utils import POINTER_TTL_SECONDS, CONSOLIDATED_TABLE
+from table_cache import TableCache
+
 # ---------------------------
 # Config & Credentials
 # ---------------------------
@@ -69,23 +78,148 @@ utils = _import_utils()
 # Query Helpers
 # ---------------------------
 
-@st.cache_data(show_spinner=False)
-def load_table(table_name):
-    cfg = get_gcp_config()
-    dataset_name = _get_secret("dataset_name", "ratesheet_processing_dataset")
-    query = f"SELECT * FROM `{cfg['project_id']}.{dataset_name}.{table_name}`"
-    return client.query(query).to_dataframe()
+# columns the result page reads, projected instead of SELECT *
+RATE_COLUMNS = ["POL", "Destination", "Carrier", "T_T_TO_POD", "Effective_Date", "Expiring_Date",
+                "GP20", "GP40", "HQ40", "HQ45", "COMM", "COMM_DETAILS", "COMMODITY", "remark"]
+
+def filter_key(filters: dict) -> tuple:
+    """Hashable, order independent form of {column: selected values} for load_table(), so the
+    cache hits whatever order the values were picked in."""
+    return tuple(sorted((col, tuple(sorted(set(values), key=str))) for col, values in filters.items()))
 
 @st.cache_resource
-def get_tables_and_client():
-    client = get_bq_client()
-    dataset = "ratesheet_processing_dataset"
-    tables = client.list_tables(dataset)
-    table_names = [t.table_id for t in tables]
-    return client, table_names
+def get_storage() -> RateStorage:
+    """Rate tables backend from the storage_backend secret: "bigquery" (default) or "sqlite",
+    a local file written by RateGeneratorJuly15.py --storage sqlite (sqlite_path secret)."""
+    backend = _get_secret("storage_backend", "bigquery")
+    if backend == "sqlite":
+        return open_storage("sqlite", sqlite_path=_get_secret("sqlite_path", "RateSheet_Project/rates.sqlite"))
+    dataset_name = _get_secret("dataset_name", "ratesheet_processing_dataset")
+    return open_storage(backend, client=get_bq_client(),
+                        dataset_ref=f"{get_gcp_config()['project_id']}.{dataset_name}")
 
-# Initialize the client and get table names
-client, table_names = get_tables_and_client()
+# query results on disk, shared by every session and worker of this host, at most table_cache_max_mb of them
+table_cache = TableCache(_get_secret("table_cache_dir", ".table_cache"),
+                         max_bytes=int(float(_get_secret("table_cache_max_mb", 1024)) * 2**20))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_table_version(table_name):
+    """Freshness token of a table for the disk cache: the name of a versioned table, the
+    modified time of any other table (checked at most once a minute)."""
+    return storage.table_version(table_name)
+
+@st.cache_data(show_spinner=False)
+def _get_table_columns(table_name, version):
+    columns = table_cache.read_columns(table_name, version)
+    if columns is None:
+        columns = storage.table_columns(table_name)
+        table_cache.write_columns(table_name, version, columns)
+    return columns
+
+def get_table_columns(table_name):
+    return _get_table_columns(table_name, get_table_version(table_name))
+
+@st.cache_data(show_spinner=False)
+def _load_table(table_name, version, columns, filters, distinct=False, not_before=()):
+    available = _get_table_columns(table_name, version)
+    if columns is not None:
+        columns = [col for col in columns if col in available]
+    cache_key = {"columns": columns, "filters": filters, "distinct": distinct, "not_before": not_before}
+    df = table_cache.read(table_name, version, cache_key)
+    if df is not None:
+        return df
+    for col, _ in filters + not_before:
+        if col not in available:
+            raise ValueError(f"unknown column {col!r} in {table_name}")
+    df = storage.read_table(table_name, columns, filters, distinct=distinct, not_before=not_before)
+    table_cache.write(table_name, version, cache_key, df)
+    return df
+
+def load_table(table_name, columns=None, filters=(), distinct=False, not_before=()):
+    """Rows of `table_name`, reading only `columns` (those missing from the table are skipped) and the
+    rows where every column of `filters` (see filter_key()) is one of its values, each combination once
+    with distinct=True; `not_before` (column, date) pairs drop rows dated before the date. Cached per
+    filter set in memory and on disk, for as long as the table version does not change."""
+    return _load_table(table_name, get_table_version(table_name), columns, filters, distinct, not_before)
+
+@st.cache_data(ttl=POINTER_TTL_SECONDS, show_spinner=False)
+def get_table_versions() -> Dict[str, str]:
+    """{table name: physical table} of the promoted rate set, re-read every 5 minutes to pick up new promotes."""
+    versions = storage.read_table_versions()
+    if versions is None:
+        # dataset not promoted by the versioned pipeline yet, every table is its own version
+        return {t: t for t in storage.list_tables() if not t.startswith("_")}
+    return versions["active"]
+
+@st.cache_data(show_spinner=False)
+def get_fee_rules():
+    """Fee schedule from the CSV named by the fee_rules_path secret, the built-in schedule otherwise."""
+    path = _get_secret("fee_rules_path")
+    return load_fee_rules(path) if path else fee_rules()
+
+# Initialize the rate tables backend
+storage = get_storage()
+
+# a bad fee schedule stops the page here, before any route is priced
+try:
+    base_fee_rules = get_fee_rules()
+except ValueError as e:
+    st.error(f"❌ Fee schedule {_get_secret('fee_rules_path')}: {e}")
+    st.stop()
+
+# one pointer snapshot per page run, so every lookup below reads the same rate set version
+table_versions = get_table_versions()
+table_names = [t for t in table_versions if t != CONSOLIDATED_TABLE]
+
+def current_rows(physical, today):
+    """`not_before` bound of load_table() that leaves out the rates expired before `today`; both route
+    index builders apply it, so a quote does not depend on whether the consolidated table exists."""
+    return (("Expiring_Date", today),) if "Expiring_Date" in get_table_columns(physical) else ()
+
+# each entry holds the whole rate set, a few cover the current version, day and date selections
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_route_index(versions, date_filters, today):
+    """Route index over the unexpired rows of every rate table matching `date_filters` (see filter_key()) with
+    its per-table value sets and keyword search index, built once per dataset version, date selection and day.
+    `versions` is the sorted (table name, physical table) pairs of the promoted set. Shared, do not modify."""
+    tables = {}
+    for table, physical in versions:
+        if any(col not in get_table_columns(physical) for col, _ in date_filters):
+            continue  # an undated table has no row on the selected dates
+        tables[table] = load_table(physical, RATE_COLUMNS, date_filters, not_before=current_rows(physical, today))
+    index = build_route_index(tables)
+    return index, route_value_sets(index), SearchIndex(index)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_consolidated_value_sets(physical, date_filters, today):
+    """Per-table value sets of the unexpired rows of the whole consolidated table matching `date_filters`,
+    from its distinct source_table / route keys, built once per version, date selection and day; the rows
+    of a route query only hold the selected values."""
+    keys = load_table(physical, ROUTE_KEYS + ["source_table"], date_filters, distinct=True,
+                      not_before=current_rows(physical, today))
+    return route_value_sets(build_route_index({table: group for table, group in keys.groupby("source_table")}))
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_consolidated_route_index(physical, route_filters, date_filters, today):
+    """Route index and keyword search index over the unexpired consolidated rows matching `route_filters` and
+    `date_filters` (see filter_key()), built once per version, selection and day, so keyword and paging reruns
+    reuse them. The Expiring_Date bound lets BigQuery read only the partitions still current. Shared, do not modify."""
+    rows = load_table(physical, RATE_COLUMNS + ["source_table"], route_filters + date_filters,
+                      not_before=current_rows(physical, today))
+    index = build_route_index({table: group.drop(columns="source_table")
+                               for table, group in rows.groupby("source_table")})
+    return index, get_consolidated_value_sets(physical, date_filters, today), SearchIndex(index)
+
+def route_index_for(routes, expiring_dates=()):
+    """(route index, value sets, search index) to match `routes` against, limited to the rates expiring on one of
+    `expiring_dates` when any are given: the consolidated rows of the selected routes when the consolidated table
+    exists, the cached index over every rate table otherwise. The dates are pushed down into the table reads."""
+    date_filters = filter_key({"Expiring_Date": [pd.Timestamp(d).date() for d in expiring_dates]}) if expiring_dates else ()
+    if CONSOLIDATED_TABLE in table_versions:
+        route_filters = filter_key({col: {r[i] for r in routes} for i, col in enumerate(ROUTE_KEYS)})
+        return get_consolidated_route_index(table_versions[CONSOLIDATED_TABLE], route_filters, date_filters, date.today())
+    versions = tuple((table, table_versions[table]) for table in sorted(table_names))
+    return get_route_index(versions, date_filters, date.today())
 
 st.write("✅ Found the following rate tables in BigQuery:")
 st.write(table_names)
@@ -93,20 +227,20 @@ st.write(table_names)
 selected_table = st.selectbox("Select a Rate Table", table_names)
 
 if selected_table:
-    df = load_table(selected_table)
+    columns_needed = ["POL", "Destination", "Effective_Date", "Expiring_Date", "T_T_TO_POD", "Carrier", "GP20", "GP40", "COMM", "COMM_DETAILS"]
+    df = load_table(table_versions[selected_table], columns_needed)
     df["POL"] = df["POL"].astype(str).str.strip()
     df["Destination"] = df["Destination"].astype(str).str.strip()
     df["Carrier"] = df["Carrier"].astype(str).str.strip()
     date_select = st.multiselect("Select Expiring Dates", sorted(df["Expiring_Date"].dropna().unique()))
 
     st.write(f"📊 Columns in `{selected_table}`:")
-    st.write(df.columns.tolist())
+    st.write(get_table_columns(table_versions[selected_table]))
 
     # Ensure necessary columns exist
     for col in ["COMM", "COMM_DETAILS"]:
         if col not in df.columns:
             df[col] = np.nan
-    columns_needed = ["POL", "Destination", "Effective_Date", "Expiring_Date", "T_T_TO_POD", "Carrier", "GP20", "GP40", "COMM", "COMM_DETAILS"]
     existing_columns = [col for col in columns_needed if col in df.columns]
     df = df[existing_columns]
 
@@ -117,6 +251,9 @@ if selected_table:
     st.sidebar.header("🔧 Filter Options")
     table_type = st.sidebar.radio("Table Type", ["Port to Port", "Port to Door"])
 
+# columns the result can be ranked by
+SORT_KEYS = ["GP20", "GP40", "20' - ALL IN", "40' or HC - ALL IN"]
+
 # Carrier Names
 carrier_options = [
     "WANHAI", "SMLM", "YML", "MSC", "OOCL", "ONE", "EMC", "COSCO", 
@@ -151,26 +288,12 @@ destination_ports = [
     'SAN ANTONIO, TX', 'SANTA TERESA, NM', 'ST. LOUIS, MO', 'ST. PAUL, MN', 'WORCESTER, MA'
 ]
 
-@st.cache_resource
-def get_tables_and_client():
-    dataset = "ratesheet_processing_dataset"
-    tables = client.list_tables(dataset)
-    table_names = [t.table_id for t in tables]
-    return client, table_names
-
 # Streamlit UI
 st.title("Shipping Rates Query")
 origin_select = st.multiselect("Select Origin Ports", origin_ports)
 destination_select = st.multiselect("Select Destination Ports", destination_ports)
 carrier_select = st.multiselect("Select Carrier", carrier_options)
 
-filtered_data = df[
-    (df['POL'].isin(origin_select)) &
-    (df['Destination'].isin(destination_select)) &
-    (df['Carrier'].isin(carrier_select)) &
-    (df["Expiring_Date"].isin(date_select))
-]
-
 trucking_fee = 0
 if table_type == "Port to Door":
     trucking_fee = st.sidebar.number_input("Trucking Fee (USD)", min_value=0.0, step=10.0)
@@ -180,68 +303,27 @@ if origin_select and destination_select and carrier_select:
     routes = [(o.upper(), d.upper(), c.upper()) for o,d,c in routes]
     st.markdown(f"### 🧾 Total {len(routes)} routes matched：")
 
-    fixed_fields = {
-        "ISF": 25,
-        "Handling": 50,
-        "Customs Clearance": 80,
-        "Duty": "AT COST",
-        "20' - CTF/PP": 48,
-        "40' - CTF/PP": 95,
-        "Chassis ($50/DAY) - min. 2 days": 100,
-        "Trucking Fee": trucking_fee
-    }
+    route_index, value_sets, search_index = route_index_for(routes, date_select)
+    matched, unmatched_routes = match_routes(route_index, routes)
 
-    combined_data = []
-
-    for origin, destination, carrier in routes:
-        found = False
-        reasons = set()
-
-        for table in table_names:
-            df = load_table(table)
-            if not {"POL","Destination","Carrier"}.issubset(df.columns):
-                continue
-            for c in ["POL","Destination","Carrier"]:
-                df[c] = df[c].astype(str).str.strip().str.upper()
-
-            m = df[(df["POL"]==origin) &
-                   (df["Destination"]==destination) &
-                   (df["Carrier"]==carrier)].copy()
-
-            if not m.empty:
-                for col, val in fixed_fields.items():
-                    m.loc[:, col] = val
-                m["20' - ALL IN"] = (m["GP20"] + fixed_fields["ISF"] +
-                                     fixed_fields["Handling"] + fixed_fields["Customs Clearance"])
-                m["40' or HC - ALL IN"] = (m["GP40"] + fixed_fields["ISF"] +
-                                           fixed_fields["Handling"] + fixed_fields["Customs Clearance"])
-                if table_type == "Port to Door":
-                    m["20' - ALL IN"] += (fixed_fields["Trucking Fee"] +
-                                          fixed_fields["20' - CTF/PP"] +
-                                          fixed_fields["Chassis ($50/DAY) - min. 2 days"])
-                    m["40' or HC - ALL IN"] += (fixed_fields["Trucking Fee"] +
-                                                fixed_fields["40' - CTF/PP"] +
-                                                fixed_fields["Chassis ($50/DAY) - min. 2 days"])
-                m.loc[:, "Sheet type"] = table_type
-                m.loc[:, "Source table"] = table
-                combined_data.append(m)
-                found = True
-            else:
-                if origin not in df["POL"].unique(): reasons.add(f"Cannot find POL: {origin}")
-                if destination not in df["Destination"].unique(): reasons.add(f"Cannot find Destination: {destination}")
-                if carrier not in df["Carrier"].unique(): reasons.add(f"Cannot find Carrier: {carrier}")
+    st.sidebar.markdown("### 💲 GP20 / GP40 Price Adjust")
+    gp20_adjust = st.sidebar.number_input("Markup/Markdown GP20（Unit：$, positive/negative）", value=0.0, step=10.0)
+    gp40_adjust = st.sidebar.number_input("Markup/Markdown GP40（Unit：$, positive/negative）", value=0.0, step=10.0)
 
-        if not found:
-            print(f"❌ Unmatched: {origin} → {destination} ｜ {carrier} ｜ Reason: {'，'.join(sorted(reasons))}")
+    # every fee, the price adjustment and all-in total of the matched rows in one pass over the fee schedule
+    matched["Sheet type"] = table_type
+    rules = base_fee_rules.to_dict("records")
+    rules.append({"fee": "Trucking Fee", "amount": trucking_fee, "sheet_type": "Port to Door"})
+    rules.append({"fee": "GP20", "amount": gp20_adjust})
+    rules.append({"fee": "GP40", "amount": gp40_adjust})
+    total_df = price_routes(matched, rules)
 
+    if unmatched_routes:
+        unmatched_df = explain_unmatched(value_sets, unmatched_routes)
+        with st.expander(f"⚠️ Unmatched routes ({len(unmatched_df)})"):
+            st.dataframe(unmatched_df, hide_index=True)
 
-    if combined_data:
-        total_df = pd.concat(combined_data, ignore_index=True)
-        total_df["ISF"] = 25
-        total_df["Handling"] = 50
-        total_df["Customs Clearance"] = 80
-        total_df["Duty"] = "AT COST"
-
+    if not total_df.empty:
         def is_integer_string(x):
             try:
                 return float(x).is_integer()
@@ -255,15 +337,6 @@ if origin_select and destination_select and carrier_select:
                 else x
             )
 
-        st.sidebar.markdown("### 💲 GP20 / GP40 Price Adjust")
-        gp20_adjust = st.sidebar.number_input("Markup/Markdown GP20（Unit：$, positive/negative）", value=0.0, step=10.0)
-        gp40_adjust = st.sidebar.number_input("Markup/Markdown GP40（Unit：$, positive/negative）", value=0.0, step=10.0)
-
-        if 'GP20' in total_df.columns:
-            total_df['GP20'] = total_df['GP20'] + gp20_adjust
-        if 'GP40' in total_df.columns:
-            total_df['GP40'] = total_df['GP40'] + gp40_adjust
-
         port_cols = ["POL", "Destination", "Carrier", "T_T_TO_POD",
                      "GP20", "GP40", "ISF", "Handling", "Customs Clearance", "Duty",
                      "20' - ALL IN", "40' or HC - ALL IN", "COMM", "COMM_DETAILS", "Expiring_Date", "来源表"]
@@ -273,59 +346,92 @@ if origin_select and destination_select and carrier_select:
 
         st.markdown("###✅ Final Ocean Freight Rate Sheet：")
 
-        keyword = st.sidebar.text_input("Input keywords（Filter remark/COMM/COMM_DETAILS）")
+        keyword = st.sidebar.text_input(
+            "Input keywords（Filter remark/COMM/COMM_DETAILS）",
+            help='Several keywords separated by spaces or commas, "a quoted phrase" or /a regex/',
+        )
         filter_action = st.sidebar.radio(
             "Filter options：",
             ("Do not filter", "Keep shifts containing keywords:", "Exclude shifts containing keywords:")
         )
+        keyword_match = st.sidebar.radio("Keywords to match：", ("any", "all"), horizontal=True)
         max_shown = st.sidebar.number_input("List up to how many cheapest shifts per route？", min_value=1, step=1, value=5)
-
-        selected_rows = []
-        col_20_all_in = "20' - ALL IN"
-
-        grouped = total_df.groupby(["POL", "Destination"])
-
-        for (pol, destination), group in grouped:
-            group = group.sort_values(by="GP20", ascending=True)
-
-            if keyword and filter_action != "Do not filter":
-                contains_keyword = group[['remark', 'COMM', 'COMM_DETAILS']].apply(
-                    lambda x: x.astype(str).str.contains(keyword, case=False, na=False)
-                ).any(axis=1)
-                if filter_action == "Keep shifts containing keywords:":
-                    group = group[contains_keyword]
-                elif filter_action == "Exclude shifts containing keywords:":
-                    group = group[~contains_keyword]
-
-            if not group.empty:
-                with st.expander(f"{pol} → {destination}"):
-                    selected_in_group = []
-                    carrier_group = group.groupby("Carrier")
-
-                    for carrier, carrier_df in carrier_group:
-                        include = st.checkbox(f"✔ include {carrier}", value=True, key=f"include_{pol}_{destination}_{carrier}")
-                        if include:
-                            carrier_df_sorted = carrier_df.sort_values(by="GP20", ascending=True)
-                            selected_idx = st.radio(
-                                f"{carrier} Carrier options:",
-                                options=list(range(len(carrier_df_sorted))),
-                                format_func=lambda idx: (
-                                    f"20' {carrier_df_sorted.iloc[idx].get('GP20', 'Null')}$ ｜ "
-                                    f"40' {carrier_df_sorted.iloc[idx].get('GP40', 'Null')}$ ｜ "
-                                    f"Remark: {carrier_df_sorted.iloc[idx].get('remark', 'Null')} ｜ "
-                                    f"COMM: {carrier_df_sorted.iloc[idx].get('COMM', 'Null')} ｜ "
-                                    f"COMM_DETAILS: {carrier_df_sorted.iloc[idx].get('COMM_DETAILS', 'Null')}"
-                                ),
-                                key=f"{pol}_{destination}_{carrier}"
-                            )
-                            selected_in_group.append(carrier_df_sorted.iloc[selected_idx])
-
-                    if selected_in_group:
-                        selected_df = pd.DataFrame(selected_in_group)
-                        selected_df = selected_df.sort_values(by="GP40", ascending=True).head(max_shown)
-                        selected_rows.extend(selected_df.to_dict("records"))
-
-        final_selected_df = pd.DataFrame(selected_rows)
+        sort_key = st.sidebar.selectbox("Rank shifts by", SORT_KEYS)
+
+        # overrides live in session state, keyed by the stable Row key of the chosen row, so they
+        # survive paging and reruns; widgets only exist for the routes on the current page
+        picks = st.session_state.setdefault("route_picks", {})
+        stale = stale_picks(total_df, picks)
+        for pick_key in stale:
+            picks.pop(pick_key)
+            st.session_state.pop(f"option_{pick_key[0]}_{pick_key[1]}_{pick_key[2]}", None)
+        if stale:
+            st.info(f"ℹ️ {len(stale)} carrier choice(s) no longer match a rate and were reset to the cheapest")
+
+        if keyword and filter_action != "Do not filter":
+            try:
+                contains_keyword = search_index.mask(keyword, how=keyword_match)[total_df["Row id"].to_numpy()]
+            except ValueError as exc:  # bad /regex/, leave the rows unfiltered
+                st.sidebar.error(str(exc))
+                contains_keyword = None
+            if contains_keyword is None:
+                pass
+            elif filter_action == "Keep shifts containing keywords:":
+                total_df = total_df[contains_keyword]
+            elif filter_action == "Exclude shifts containing keywords:":
+                total_df = total_df[~contains_keyword]
+
+        # default selection: cheapest shift per carrier, then the cheapest max_shown carriers per route;
+        # the widgets below only record where the user deviates from it
+        ranked_df = rank_rates(total_df, sort_key)
+        labels = dict(zip(ranked_df["Row key"].tolist(), option_labels(ranked_df)))
+
+        def remember_include(pick_key, widget_key):
+            if st.session_state[widget_key]:
+                picks.pop(pick_key, None)
+            else:
+                picks[pick_key] = EXCLUDED
+
+        def remember_option(pick_key, widget_key):
+            picks[pick_key] = st.session_state[widget_key]
+
+        def reset_picks():
+            picks.clear()
+            for key in [k for k in st.session_state if str(k).startswith(("include_", "option_"))]:
+                del st.session_state[key]
+
+        route_list = ranked_df[ROUTE_GROUP].drop_duplicates()
+        page_size = st.sidebar.selectbox("Routes per page", [10, 25, 50, 100])
+        page_count = max(1, -(-len(route_list) // page_size))
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1)
+        page_routes = route_list.iloc[(page - 1) * page_size: page * page_size]
+        on_page = pd.MultiIndex.from_frame(ranked_df[ROUTE_GROUP]).isin(pd.MultiIndex.from_frame(page_routes))
+
+        if picks:
+            st.button("↺ Reset carrier choices", on_click=reset_picks)
+
+        for (pol, destination), group in ranked_df[on_page].groupby(ROUTE_GROUP, sort=False, observed=True):
+            with st.expander(f"{pol} → {destination}"):
+                for carrier, carrier_df_sorted in group.groupby("Carrier", sort=True, observed=True):
+                    pick_key = (pol, destination, carrier)
+                    include_key = f"include_{pol}_{destination}_{carrier}"
+                    include = st.checkbox(f"✔ include {carrier}", value=picks.get(pick_key) != EXCLUDED,
+                                          key=include_key, on_change=remember_include, args=(pick_key, include_key))
+                    if not include:
+                        continue
+                    options = list(dict.fromkeys(carrier_df_sorted["Row key"].tolist()))  # identical rows once
+                    option_key = f"option_{pol}_{destination}_{carrier}"
+                    current = picks.get(pick_key)
+                    st.radio(
+                        f"{carrier} Carrier options:",
+                        options=options,
+                        index=options.index(current) if current in options else 0,
+                        format_func=labels.get,
+                        key=option_key,
+                        on_change=remember_option, args=(pick_key, option_key),
+                    )
+
+        final_selected_df = select_rates(ranked_df, sort_key, max_shown, picks)
         final_selected_df = final_selected_df.reindex(columns=display_cols)
 
         if table_type == "Port to Port":
@@ -0,0 +1,120 @@
+"""
+Disk cache of BigQuery query results, shared by every Streamlit session and worker on the host.
+
+Each result is a Parquet file under <directory>/<table>/, named after the table version it
+was read from and the query (columns and filters) that produced it. The version is the
+physical table name for tables promoted by the versioned pipeline, since those are never
+rewritten, and the table's BigQuery `modified` timestamp otherwise. When a table's version
+changes its older files are dropped on the next write, so a stale result is never served.
+
+Within a version every distinct query adds a file, so the directory is also held under
+`max_bytes`: a read marks its file as used (modified time), and a write drops the least
+recently used results of any table until the cache fits again.
+"""
+import os
+import json
+import uuid
+
+import pandas as pd
+
+from normalization_cache import table_fingerprint
+
+
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB
+
+
+class TableCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+
+    def _table_dir(self, table_name):
+        return os.path.join(self.directory, table_name)
+
+    def _path(self, table_name, version, key):
+        version_tag = table_fingerprint(version)[:12]
+        return os.path.join(self._table_dir(table_name), f"{version_tag}_{table_fingerprint(key)[:16]}.parquet")
+
+    def _write_atomic(self, path, write):
+        # write then rename, so concurrent readers never see a half-written file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _prune(self, table_name, version):
+        keep = table_fingerprint(version)[:12] + "_"
+        table_dir = self._table_dir(table_name)
+        for name in os.listdir(table_dir):
+            if name.endswith((".parquet", ".json")) and not name.startswith(keep):
+                try:
+                    os.remove(os.path.join(table_dir, name))
+                except FileNotFoundError:
+                    pass  # another worker pruned it first
+
+    def _evict(self):
+        # least recently used results first, until every table's results fit in max_bytes
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".parquet"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # pruned or evicted by another worker
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def read(self, table_name, version, key):
+        """ Cached frame of `key` (any JSON-able description of the query) at `version`, None on a miss """
+        path = self._path(table_name, version, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except (OSError, ValueError):
+            return None  # truncated or unreadable, query again
+        try:
+            os.utime(path)  # recently used, evicted last
+        except OSError:
+            pass
+        return df
+
+    def write(self, table_name, version, key, df):
+        """ Store `df`; frames Arrow cannot hold are skipped, the caller still has the data """
+        path = self._path(table_name, version, key)
+        try:
+            self._write_atomic(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+        except (OSError, ValueError, TypeError, ImportError) as exc:
+            print(f"⚠️ Not caching {table_name}: {type(exc).__name__}: {exc}")
+            return
+        self._prune(table_name, version)
+        self._evict()
+
+    def read_columns(self, table_name, version):
+        path = self._path(table_name, version, "columns").replace(".parquet", ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_columns(self, table_name, version, columns):
+        path = self._path(table_name, version, "columns").replace(".parquet", ".json")
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(columns), f)
+        self._write_atomic(path, write)
@@ -0,0 +1,47 @@
+from alias_matcher import AliasMatcher
+from ratesheet_cleaning import port_alias_matcher
+
+
+def test_find_all_reports_overlapping_hits():
+    matcher = AliasMatcher().add("HE", "A").add("SHE", "B").add("HERS", "C").build()
+    hits = sorted(matcher.find_all("USHERS"))
+    assert hits == [(1, 0, "SHE", "B"), (2, 0, "HE", "A"), (2, 0, "HERS", "C")]
+    assert matcher.find_all("XYZ") == []
+    assert matcher.best("XYZ") is None
+
+
+def test_earliest_entry_wins_over_position_and_length():
+    matcher = AliasMatcher.from_mapping({"FIRST": ["PORT"], "SECOND": ["X", "LONGPORT"]})
+    # "X" and "LONGPORT" start further left, "LONGPORT" is longer, the earlier entry still wins
+    assert matcher.best("XLONGPORT") == "FIRST"
+
+
+def test_leftmost_hit_wins_within_an_entry_priority():
+    matcher = AliasMatcher().add("NGB", "NINGBO").add("SHA", "SHANGHAI").build()
+    assert matcher.best("SHA/NGB") == "SHANGHAI"
+    assert matcher.best("NGB/SHA") == "NINGBO"
+
+
+def test_longest_hit_wins_at_the_same_start():
+    matcher = AliasMatcher().add("QING", "QINGZHOU").add("QINGDAO", "QINGDAO").build()
+    assert matcher.best("QINGDAO PORT") == "QINGDAO"
+
+
+def test_lazy_build_after_add():
+    matcher = AliasMatcher.from_mapping({"A": ["ABC"]})
+    matcher.add("BC", "B", priority=-1)
+    assert matcher.best("ABC") == "B"
+
+
+def test_empty_alias_is_ignored():
+    assert AliasMatcher().add("", "NOWHERE").build().find_all("anything") == []
+
+
+def test_ambiguous_aliases():
+    matcher = AliasMatcher.from_mapping({"A": ["X", "Y"], "B": ["X"], "C": ["Y", "Z"], "D": ["X"]})
+    assert matcher.ambiguous_aliases() == {"X": ["A", "B", "D"], "Y": ["A", "C"]}
+
+
+def test_port_aliases_resolve_zjg_to_the_first_listed_port():
+    assert port_alias_matcher.best("ZJG") == "ZHENJIANG, JIANGSU"
+    assert port_alias_matcher.ambiguous_aliases()["ZJG"] == ["ZHENJIANG, JIANGSU", "ZHANGJIAGANG, JIANGSU"]
@@ -0,0 +1,64 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import route_engine
+from rate_storage import SQLiteStorage
+
+APP = __file__.rsplit("/tests/", 1)[0] + "/streamlit_app.py"
+VERSION = "20250101T000000"
+
+
+@pytest.fixture
+def rate_set(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "rates.sqlite"))
+    rates = pd.DataFrame({
+        "POL": ["SHANGHAI", "SHANGHAI", "NINGBO, ZHEJIANG"], "Destination": ["LAX/LGB"] * 3,
+        "Carrier": ["MSC"] * 3, "GP20": [900.0, 1000.0, 800.0], "GP40": [1800.0, 2000.0, 1600.0],
+        "Effective_Date": [datetime.date(2023, 1, 1)] * 3,
+        "Expiring_Date": [datetime.date(2024, 1, 1), datetime.date(2099, 1, 1), datetime.date(2099, 1, 1)],
+    })
+    storage.write_tables({f"agent_a__v{VERSION}": rates})
+    storage.promote_table_versions({"agent_a": f"agent_a__v{VERSION}"}, {}, VERSION)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    yield tmp_path
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def _select(at, label, values):
+    next(w for w in at.multiselect if w.label == label).set_value(values).run()
+    assert not at.exception, at.exception
+
+
+def test_route_index_built_once_across_selection_reruns(rate_set, monkeypatch):
+    builds = []
+    build_route_index = route_engine.build_route_index
+
+    def counting(tables):
+        builds.append(sorted(tables))
+        return build_route_index(tables)
+
+    monkeypatch.setattr(route_engine, "build_route_index", counting)
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.secrets["storage_backend"] = "sqlite"
+    at.secrets["sqlite_path"] = str(rate_set / "rates.sqlite")
+    at.secrets["table_cache_dir"] = str(rate_set / "cache")
+    at.run()
+    assert not at.exception, at.exception
+
+    _select(at, "Select Origin Ports", ["SHANGHAI"])
+    _select(at, "Select Destination Ports", ["LAX/LGB"])
+    _select(at, "Select Carrier", ["MSC"])
+    _select(at, "Select Origin Ports", ["SHANGHAI", "NINGBO, ZHEJIANG"])
+
+    assert builds == [["agent_a"]]
+    quotes = at.dataframe[-1].value
+    # the expired SHANGHAI row never reaches the index
+    assert sorted(quotes["20'"].tolist()) == [800.0, 1000.0]
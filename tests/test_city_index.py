@@ -0,0 +1,57 @@
+import pandas as pd
+
+import ratesheet_cleaning
+from ratesheet_cleaning import build_city_index, city_index, fuzzy_match_city, resolve_city_values
+
+
+def test_index_holds_alias_tokens_not_characters():
+    index = build_city_index({"LAX/LGB": "LOS ANGELES, LAX, LGB, LONG BEACH", "CHICAGO, IL": "CHICAGO, CHI"})
+    assert index == {
+        "LAX/LGB": "LAX/LGB",
+        "LOS ANGELES": "LAX/LGB",
+        "LAX": "LAX/LGB",
+        "LGB": "LAX/LGB",
+        "LONG BEACH": "LAX/LGB",
+        "CHICAGO": "CHICAGO, IL",
+        "CHI": "CHICAGO, IL",
+    }
+    assert all(len(token) > 1 for token in city_index)
+
+
+def test_first_city_wins_a_shared_token():
+    index = build_city_index({"PORTLAND, OR": "PORTLAND, PDX", "PORTLAND, ME": "PORTLAND, PWM"})
+    assert index["PORTLAND"] == "PORTLAND, OR"
+    assert index["PWM"] == "PORTLAND, ME"
+
+
+def test_exact_tokens_resolve_without_substring_hits():
+    assert fuzzy_match_city("Long Beach, CA") == "LAX/LGB"
+    assert fuzzy_match_city("Joliet-IL") == "CHICAGO, IL"
+    assert fuzzy_match_city("usnyc") == "NEW YORK, NY"
+    # the old substring test sent these to the first city whose keyword string contained them
+    assert fuzzy_match_city("SAN") == "SAN"
+    assert fuzzy_match_city("TX") == "TX"
+
+
+def test_fuzzy_fallback_scores_against_whole_tokens():
+    # scored against single characters this resolved to LAX/LGB
+    assert fuzzy_match_city("Chicgo") == "CHICAGO, IL"
+    assert fuzzy_match_city("ZZZZ") == "ZZZZ"
+
+
+def test_fuzzy_fallback_is_batched_over_unique_city_parts(monkeypatch):
+    calls = []
+    best_matches = ratesheet_cleaning._best_matches
+
+    def counting(queries, choices):
+        calls.append(list(queries))
+        return best_matches(queries, choices)
+
+    monkeypatch.setattr(ratesheet_cleaning, "_best_matches", counting)
+    resolved = resolve_city_values(["Chicgo", "CHICGO - IL", "Houston, TX", "ZZZZ", "", None])
+    assert calls == [["CHICGO", "ZZZZ"]]
+    assert resolved["Chicgo"] == resolved["CHICGO - IL"] == "CHICAGO, IL"
+    assert resolved["Houston, TX"] == "HOUSTON, TX"
+    assert resolved["ZZZZ"] == "ZZZZ"
+    assert resolved[""] == ""
+    assert pd.isna(resolved[None])
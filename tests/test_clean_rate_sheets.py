@@ -0,0 +1,23 @@
+import pandas as pd
+
+from benchmarks.cleaning_pipeline import write_synthetic_workbook
+from ratesheet_cleaning import clean_rate_sheets, use_normalization_cache
+
+
+def test_pool_matches_serial_run_and_reports_bad_sheets(tmp_path):
+    use_normalization_cache(None)
+    paths = [write_synthetic_workbook(str(tmp_path / f"agent_{seed}_2025.xlsx"), rows=30, seed=seed) for seed in range(3)]
+    broken = tmp_path / "broken_2025.xlsx"
+    broken.write_bytes(b"not a workbook")
+    paths.insert(1, str(broken))
+
+    serial = clean_rate_sheets(paths, workers=1)
+    pooled = clean_rate_sheets(paths, workers=3)
+
+    for dfs, read_stats, errors in (serial, pooled):
+        assert list(dfs) == list(read_stats) == [paths[0], *paths[2:]]
+        assert list(errors) == [str(broken)]
+    for path in serial[0]:
+        pd.testing.assert_frame_equal(pooled[0][path], serial[0][path])
+        assert pooled[1][path]["header_row"] == serial[1][path]["header_row"]
+    assert pooled[2] == serial[2]
@@ -0,0 +1,51 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from ratesheet_cleaning import UPLOAD_COLUMNS, load_upload_frame, write_cleaned_frame
+
+
+def _cleaned():
+    return pd.DataFrame({
+        "POL": ["SHANGHAI", "NINGBO", "QINGDAO"],
+        "Destination": ["LAX/LGB", "NIL", "CHICAGO, IL"],
+        "Effective_Date": ["2025-07-15", "2025-07-31", None],
+        "Expiring_Date": ["2025-08-15", None, "2025-08-31"],
+        "GP20": [1000.0, np.nan, 1200.0],
+        "GP40": [2000.0, 2100.0, np.nan],
+        "remark": ["SUBJECT TO GRI", 45, "-"],  # agents mix numbers into text columns
+        7: ["unused", "extra", "column"],
+    })
+
+
+def test_parquet_written_with_mixed_columns_as_text(tmp_path):
+    path = tmp_path / "rates.parquet"
+    written = write_cleaned_frame(_cleaned(), path)
+    assert written["remark"].tolist() == ["SUBJECT TO GRI", "45", "-"]
+    assert "7" in written.columns
+    back = pd.read_parquet(path)
+    assert back.columns.tolist() == written.columns.tolist()
+    assert back["GP20"].dtype == "float64"
+    assert not (tmp_path / "rates.xlsx").exists()
+
+
+def test_excel_copy_written_on_request(tmp_path):
+    write_cleaned_frame(_cleaned(), tmp_path / "rates.parquet", excel_export=True)
+    assert pd.read_excel(tmp_path / "rates.xlsx")["POL"].tolist() == ["SHANGHAI", "NINGBO", "QINGDAO"]
+
+
+def test_upload_frame_typed_for_the_upload_schema(tmp_path):
+    path = tmp_path / "rates.parquet"
+    write_cleaned_frame(_cleaned(), path)
+    df = load_upload_frame(path)
+
+    assert df.columns.tolist() == UPLOAD_COLUMNS
+    assert df["GP20"].dtype == df["HQ45"].dtype == "float64"
+    assert df["GP20"].isna().tolist() == [False, True, False] and df["HQ45"].isna().all()
+    assert df["Effective_Date"].tolist() == [datetime.date(2025, 7, 15), datetime.date(2025, 7, 31), None]
+    assert df["Expiring_Date"].iloc[1] is None
+    assert df["POL"].dtype == "string" and df["Carrier"].isna().all()
+    # NIL / - placeholders are empty, real text is kept
+    assert df["Destination"].isna().tolist() == [False, True, False]
+    assert df["remark"].tolist()[:2] == ["SUBJECT TO GRI", "45"] and pd.isna(df["remark"].iloc[2])
@@ -0,0 +1,49 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from ratesheet_cleaning import parse_date_column, standardize_date_columns
+
+
+def test_each_format_parsed_in_its_own_pass():
+    col = pd.Series(["07/15/2025", "2025-07-31", "31/07/2025", "2025/08/01", "15-Aug-2025", "2025.08.31"], dtype=object)
+    dates, hits = parse_date_column(col, 2025)
+    assert dates.dt.strftime("%Y-%m-%d").tolist() == [
+        "2025-07-15", "2025-07-31", "2025-07-31", "2025-08-01", "2025-08-15", "2025-08-31"]
+    assert hits == {"%m/%d/%Y": 1, "%Y-%m-%d": 1, "%d/%m/%Y": 1, "%Y/%m/%d": 1, "%d-%b-%Y": 1, "%Y.%m.%d": 1}
+
+
+def test_excel_serials_and_native_datetimes():
+    numeric, hits = parse_date_column(pd.Series([45853, 45869.0, np.nan]), 2025)
+    assert numeric.dt.strftime("%Y-%m-%d").tolist()[:2] == ["2025-07-15", "2025-07-31"]
+    assert pd.isna(numeric.iloc[2]) and hits == {"excel serial": 2}
+
+    mixed = pd.Series([datetime.datetime(2025, 7, 15), "45869", "7/31/2025", "NIL", None], dtype=object)
+    dates, hits = parse_date_column(mixed, 2025)
+    assert dates.dt.strftime("%Y-%m-%d").tolist()[:3] == ["2025-07-15", "2025-07-31", "2025-07-31"]
+    assert dates.iloc[3:].isna().all()
+    assert hits == {"excel serial": 1, "datetime": 1, "%m/%d/%Y": 1}
+
+
+def test_years_far_from_the_file_year_are_moved():
+    col = pd.Series(["07/15/2052", "12/31/2024", "01/15/2026"], dtype=object)
+    dates, _ = parse_date_column(col, 2025)
+    assert dates.dt.strftime("%Y-%m-%d").tolist() == ["2025-07-15", "2024-12-31", "2026-01-15"]
+
+
+def test_unknown_layouts_fall_back_to_inference():
+    dates, hits = parse_date_column(pd.Series(["July 15, 2025", "not a date"], dtype=object), 2025)
+    assert dates.iloc[0] == pd.Timestamp("2025-07-15") and pd.isna(dates.iloc[1])
+    assert hits == {"inferred": 1}
+
+
+def test_standardize_formats_date_columns_and_counts_passes():
+    df = pd.DataFrame({"Effective Date": ["07/15/2052", 45869], "Expiring_Date": ["2025-07-31", None],
+                       "POL": ["SHANGHAI", "NINGBO"]})
+    date_hits = {}
+    out = standardize_date_columns(df, "Rates July 2025.xlsx", date_hits)
+    assert out["Effective Date"].tolist() == ["2025-07-15", "2025-07-31"]
+    assert out["Expiring_Date"].iloc[0] == "2025-07-31" and pd.isna(out["Expiring_Date"].iloc[1])
+    assert out["POL"].tolist() == ["SHANGHAI", "NINGBO"]
+    assert date_hits == {"excel serial": 1, "%m/%d/%Y": 1, "%Y-%m-%d": 1}
@@ -0,0 +1,65 @@
+import pandas as pd
+from openpyxl import Workbook
+
+from ratesheet_cleaning import _sheet_formula_values, extract_formula_values
+
+HEADER = ["POL", "Destination", "GP20", "GP40"]
+
+
+def _workbook(path, sheets):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for title, rows in sheets.items():
+        ws = wb.create_sheet(title)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+    return path
+
+
+def _rates(n):
+    return [["SHANGHAI", "LAX/LGB", 1000 + i, 2000 + i] for i in range(n)]
+
+
+def test_header_found_below_title_rows_and_rows_chunked(tmp_path):
+    path = _workbook(tmp_path / "rates.xlsx", {"Rates": [["July rates"], [None], HEADER] + _rates(7)})
+    for chunk_size in (2, 3, 50000):
+        df = extract_formula_values(path, chunk_size=chunk_size)
+        assert df.columns.tolist() == HEADER
+        assert df["GP20"].tolist() == list(range(1000, 1007))
+        assert df.index.tolist() == list(range(7))
+
+
+def test_sheet_selection(tmp_path):
+    path = _workbook(tmp_path / "rates.xlsx", {"Notes": [["remarks only"]], "Rates": [HEADER] + _rates(2)})
+    assert extract_formula_values(path).columns.tolist() == ["remarks only"]
+    assert extract_formula_values(path, sheet_name="Rates")["GP40"].tolist() == [2000, 2001]
+    sheets = extract_formula_values(path, all_sheets=True)
+    assert list(sheets) == ["Notes", "Rates"]
+    assert len(sheets["Notes"]) == 0 and len(sheets["Rates"]) == 2
+
+
+def test_header_only_and_empty_sheets(tmp_path):
+    path = _workbook(tmp_path / "rates.xlsx", {"Header": [HEADER], "Empty": []})
+    sheets = extract_formula_values(path, all_sheets=True)
+    assert sheets["Header"].columns.tolist() == HEADER and sheets["Header"].empty
+    assert sheets["Empty"].empty
+
+
+class _RaggedSheet:
+    """ read-only worksheets without a dimension record yield rows of their own length """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_rows(self, values_only=True):
+        return iter(self.rows)
+
+
+def test_ragged_rows_fitted_to_the_header():
+    ws = _RaggedSheet([("POL", "Destination", None), ("SHANGHAI",), ("NINGBO", "CHICAGO, IL", 1, "extra")])
+    df = _sheet_formula_values(ws, chunk_size=1)
+    assert df.columns.tolist() == ["POL", "Destination", "Unnamed: 2"]
+    assert df.iloc[0].tolist()[:1] == ["SHANGHAI"] and df.iloc[0, 1:].isna().all()
+    assert df.iloc[1].tolist() == ["NINGBO", "CHICAGO, IL", 1]
+    pd.testing.assert_index_equal(df.index, pd.RangeIndex(2))
@@ -0,0 +1,33 @@
+import os
+
+import pandas as pd
+
+import ratesheet_cleaning
+from benchmarks.cleaning_pipeline import HEADER, write_synthetic_workbook
+from ratesheet_cleaning import read_rate_sheet
+
+
+def test_one_parse_matches_read_excel_with_the_detected_header(tmp_path, monkeypatch):
+    for seed in range(4):
+        path = write_synthetic_workbook(str(tmp_path / f"agent_{seed}.xlsx"), rows=40, seed=seed)
+        raw = pd.read_excel(path, header=None, dtype=object)
+        header_row = raw.index[raw[0].astype(str).str.contains("POL")][0]
+        expected = pd.read_excel(path, header=header_row)
+
+        calls = []
+        read_excel = pd.read_excel
+        monkeypatch.setattr(ratesheet_cleaning.pd, "read_excel", lambda *a, **k: calls.append(a) or read_excel(*a, **k))
+        df, stats = read_rate_sheet(path)
+        monkeypatch.undo()
+
+        assert len(calls) == 1
+        pd.testing.assert_frame_equal(df, expected)
+        assert list(df.columns) == HEADER
+        assert stats == {"header_row": header_row, "rows": header_row + 41, "bytes": os.path.getsize(path)}
+
+
+def test_empty_workbook(tmp_path):
+    path = tmp_path / "empty.xlsx"
+    pd.DataFrame().to_excel(path, index=False)
+    df, stats = read_rate_sheet(path)
+    assert df.empty and stats["rows"] == 0 and stats["header_row"] == 0
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+import ratesheet_cleaning
+from normalization_cache import NormalizationCache, table_fingerprint
+from ratesheet_cleaning import cache_counters, resolve_carrier_column, resolve_pol_column, use_normalization_cache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    path = tmp_path / "normalization_cache.sqlite"
+    use_normalization_cache(path)
+    yield path
+    use_normalization_cache(None)
+
+
+def _reset_counters():
+    for counters in cache_counters.values():
+        counters.update(hits=0, misses=0)
+
+
+def test_lookup_and_store(tmp_path):
+    cache = NormalizationCache(tmp_path / "cache.sqlite")
+    cache.store("POL", "f1", {"YANTIAN, SHENZHEN": "SHENZHEN, GUANGDONG"})
+    assert cache.lookup("POL", "f1", ["YANTIAN, SHENZHEN", "LA/LB"]) == {"YANTIAN, SHENZHEN": "SHENZHEN, GUANGDONG"}
+    assert cache.lookup("Carrier", "f1", ["YANTIAN, SHENZHEN"]) == {}
+    # more raw values than SQLite takes parameters in one statement
+    many = {f"raw {i}": f"canonical {i}" for i in range(1200)}
+    cache.store("Destination", "f1", many)
+    assert cache.lookup("Destination", "f1", list(many)) == many
+
+
+def test_new_fingerprint_drops_stale_rows(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    NormalizationCache(path).store("POL", table_fingerprint({"OLD": []}, 75), {"SHA": "SHANGHAI"})
+    cache = NormalizationCache(path)
+    assert cache.lookup("POL", table_fingerprint({"NEW": []}, 75), ["SHA"]) == {}
+    assert cache.lookup("POL", table_fingerprint({"OLD": []}, 75), ["SHA"]) == {}
+    assert table_fingerprint({"A": [1]}, 75) != table_fingerprint({"A": [1]}, 80)
+
+
+def test_warm_cache_skips_matching(cache_path, monkeypatch):
+    col = pd.Series(["Ningpo", "HLCU", "Qingdoa", None, "Ningpo"], dtype=object)
+    _reset_counters()
+    cold = resolve_pol_column(col)
+    assert cache_counters["POL"] == {"hits": 0, "misses": 3}
+
+    def no_matching(*args):
+        raise AssertionError("warm cache must not match again")
+
+    monkeypatch.setattr(ratesheet_cleaning, "_best_matches", no_matching)
+    monkeypatch.setattr(ratesheet_cleaning, "_match_pol_alias", no_matching)
+    _reset_counters()
+    use_normalization_cache(cache_path)  # a new run, same file
+    warm = resolve_pol_column(col)
+    pd.testing.assert_series_equal(warm, cold)
+    assert cache_counters["POL"] == {"hits": 3, "misses": 0}
+
+    # kinds are cached apart
+    monkeypatch.undo()
+    _reset_counters()
+    resolve_carrier_column(pd.Series(["HLCU"]))
+    assert cache_counters["Carrier"] == {"hits": 0, "misses": 1}
@@ -0,0 +1,85 @@
+from pipeline_manifest import PipelineManifest
+
+BIGQUERY = "bigquery:project.dataset"
+SQLITE = "sqlite:/tmp/rates.sqlite"
+
+
+def _workbooks(tmp_path, *names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def _record_all(manifest, paths, version="v1"):
+    for path in paths:
+        manifest.record(path, version, path.rsplit("/", 1)[-1], path + ".parquet")
+    manifest.save()
+
+
+def test_switching_storage_target_uploads_everything(tmp_path):
+    paths = _workbooks(tmp_path, "a.xlsx", "b.xlsx")
+    manifest_path = tmp_path / "pipeline.manifest"
+    manifest = PipelineManifest(manifest_path, BIGQUERY)
+    manifest.plan(paths, "v1")
+    _record_all(manifest, paths)
+
+    plan = PipelineManifest(manifest_path, SQLITE).plan(paths, "v1")
+    assert plan == {"changed": paths, "unchanged": [], "removed": {}}
+
+    # each target keeps its own entries
+    sqlite = PipelineManifest(manifest_path, SQLITE)
+    sqlite.plan(paths[:1], "v1")
+    _record_all(sqlite, paths[:1])
+    assert PipelineManifest(manifest_path, BIGQUERY).plan(paths, "v1")["unchanged"] == paths
+    plan = PipelineManifest(manifest_path, SQLITE).plan(paths, "v1")
+    assert plan["changed"] == paths[1:] and plan["unchanged"] == paths[:1]
+
+
+def test_plan_splits_changed_unchanged_and_removed(tmp_path):
+    paths = _workbooks(tmp_path, "a.xlsx", "b.xlsx", "c.xlsx")
+    manifest_path = tmp_path / "pipeline.manifest"
+    manifest = PipelineManifest(manifest_path, BIGQUERY)
+    assert manifest.plan(paths, "v1")["changed"] == paths
+    _record_all(manifest, paths)
+
+    (tmp_path / "b.xlsx").write_bytes(b"edited")
+    manifest = PipelineManifest(manifest_path, BIGQUERY)
+    plan = manifest.plan([paths[0], paths[1]], "v1")
+    assert plan["changed"] == [paths[1]] and plan["unchanged"] == [paths[0]]
+    assert list(plan["removed"]) == ["c.xlsx"]
+    assert plan["removed"]["c.xlsx"]["output_table"] == "c.xlsx"
+
+    manifest.forget("c.xlsx")
+    manifest.record(paths[1], "v1", "b.xlsx", paths[1] + ".parquet")
+    manifest.save()
+    plan = PipelineManifest(manifest_path, BIGQUERY).plan(paths[:2], "v1")
+    assert plan == {"changed": [], "unchanged": paths[:2], "removed": {}}
+
+
+def test_new_pipeline_version_or_full_refresh_reprocesses(tmp_path):
+    paths = _workbooks(tmp_path, "a.xlsx")
+    manifest_path = tmp_path / "pipeline.manifest"
+    manifest = PipelineManifest(manifest_path, BIGQUERY)
+    manifest.plan(paths, "v1")
+    _record_all(manifest, paths)
+
+    manifest = PipelineManifest(manifest_path, BIGQUERY)
+    assert manifest.plan(paths, "v2")["changed"] == paths
+    assert manifest.plan(paths, "v1", full_refresh=True)["changed"] == paths
+    assert manifest.plan(paths, "v1")["unchanged"] == paths
+
+
+def test_save_replaces_the_file_atomically(tmp_path):
+    paths = _workbooks(tmp_path, "a.xlsx")
+    manifest_path = tmp_path / "pipeline.manifest"
+    manifest = PipelineManifest(manifest_path, BIGQUERY)
+    manifest.plan(paths, "v1")
+    _record_all(manifest, paths)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.xlsx", "pipeline.manifest"]
+    entry = PipelineManifest(manifest_path, BIGQUERY).sources["a.xlsx"]
+    assert entry["pipeline_version"] == "v1" and entry["cleaned_path"] == paths[0] + ".parquet"
+    assert len(entry["content_hash"]) == 64
@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process
+
+import ratesheet_cleaning
+from benchmarks.cleaning_pipeline import _pol
+from ratesheet_cleaning import port_aliases, resolve_pol_column, use_normalization_cache
+
+
+def per_cell_fuzzy_match_pol(pol):
+    """ The per-cell matcher the batched resolver replaced """
+    if pd.isna(pol) or pol.strip() == "":
+        return pol
+    pol = pol.upper().strip()
+    for full_name, aliases in port_aliases.items():
+        if any(code in pol for code in aliases):
+            return full_name
+    best_match, score, _ = process.extractOne(pol, list(port_aliases.keys()))
+    return best_match if score > 75 else pol
+
+
+def test_batched_resolver_matches_per_cell_results():
+    use_normalization_cache(None)
+    rng = random.Random(7)
+    values = [_pol(rng) for _ in range(300)] + ["", "   ", None, "NOWHERE AT ALL", "Shanghai port", "ZJG"]
+    col = pd.Series(values, dtype=object)
+    expected = col.map(per_cell_fuzzy_match_pol)
+    pd.testing.assert_series_equal(resolve_pol_column(col), expected)
+
+
+def test_only_distinct_values_are_scored_once(monkeypatch):
+    use_normalization_cache(None)
+    calls = []
+    best_matches = ratesheet_cleaning._best_matches
+
+    def counting(queries, choices):
+        calls.append(list(queries))
+        return best_matches(queries, choices)
+
+    monkeypatch.setattr(ratesheet_cleaning, "_best_matches", counting)
+    col = pd.Series(["Ningpo", "ningpo ", "NINGPO", "Qingdoa", "ZJG", np.nan] * 1000, dtype=object)
+    resolved = resolve_pol_column(col)
+    assert calls == [["NINGPO", "QINGDOA"]]
+    assert set(resolved.dropna()) == {"NINGBO, ZHEJIANG", "QINGDAO, SHANDONG", "ZHENJIANG, JIANGSU"}
+    assert resolved.isna().sum() == 1000
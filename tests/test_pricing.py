@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from pricing import fee_rules, load_fee_rules, price_routes
+
+CSV_HEADER = "fee,amount,unit,container,sheet_type,carrier,pol\n"
+
+
+def test_blank_container_and_unit_in_csv(tmp_path):
+    path = tmp_path / "rules.csv"
+    path.write_text(CSV_HEADER + "ISF,25,,,,,\nCTF,48,USD,20,,,\nBAF,10,%,,,,\n")
+    rules = load_fee_rules(path)
+    assert rules["container"].tolist() == ["all", "20", "all"]
+    assert rules["unit"].tolist() == ["USD", "USD", "%"]
+
+    priced = price_routes(pd.DataFrame({"GP20": [1000.0], "GP40": [2000.0]}), rules)
+    assert priced["20' - ALL IN"].tolist() == [1000 + 25 + 48 + 100]
+    assert priced["40' or HC - ALL IN"].tolist() == [2000 + 25 + 200]
+
+
+def test_numeric_container():
+    assert fee_rules([{"fee": "CTF", "amount": 95, "container": 40.0}])["container"].tolist() == ["40"]
+
+
+@pytest.mark.parametrize("field, value", [("container", "45"), ("unit", "EUR")])
+def test_unknown_values_rejected(field, value):
+    rule = {"fee": "X", "amount": 1, field: value}
+    with pytest.raises(ValueError, match=field):
+        fee_rules([rule])
+
+
+def test_markup_rules_reach_the_all_in_totals():
+    rates = pd.DataFrame({"GP20": [1000.0, 1500.0], "GP40": [2000.0, 2500.0], "Carrier": ["MSC", "ONE"]})
+    rules = [{"fee": "BAF", "amount": 10, "unit": "%"}, {"fee": "GP20", "amount": 50},
+             {"fee": "GP40", "amount": -100}, {"fee": "GP40", "amount": 5, "unit": "%", "carrier": "ONE"}]
+    priced = price_routes(rates, rules)
+    assert priced["GP20"].tolist() == [1050.0, 1550.0]
+    assert priced["GP40"].tolist() == [1900.0, 2525.0]
+    # percentages are of the freight as loaded, the markup is in the totals
+    assert priced["20' - ALL IN"].tolist() == [1000 + 100 + 50, 1500 + 150 + 50]
+    assert priced["40' or HC - ALL IN"].tolist() == [2000 + 200 - 100, 2500 + 250 - 100 + 125]
+    assert "BAF" in priced.columns and priced["BAF"].tolist() == ["10%", "10%"]
+
+
+def test_mixed_units_in_one_fee_column_rejected():
+    with pytest.raises(ValueError, match="BAF"):
+        fee_rules([{"fee": "BAF", "amount": 10, "unit": "%"}, {"fee": "BAF", "amount": 40, "carrier": "MSC"}])
+
+
+def test_markup_on_another_container_rejected():
+    with pytest.raises(ValueError, match="GP20"):
+        fee_rules([{"fee": "GP20", "amount": 10, "container": "40"}])
+    assert fee_rules([{"fee": "GP40", "amount": 10}])["container"].tolist() == ["40"]
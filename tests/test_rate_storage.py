@@ -0,0 +1,126 @@
+import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from bigquery_utils import split_retired, RETIRED_GRACE_SECONDS
+from rate_storage import BigQueryStorage, SQLiteStorage
+
+VERSION = "20250101T000000"
+
+
+def _rates(pol, carrier):
+    return pd.DataFrame({"POL": [f" {pol.lower()}"], "Destination": ["LAX/LGB"], "Carrier": [carrier],
+                         "GP20": [1000.0], "Expiring_Date": [datetime.date(2025, 7, 31)]})
+
+
+def test_consolidated_table_over_many_tables(tmp_path):
+    storage = SQLiteStorage(tmp_path / "rates.sqlite")
+    # more tables than SQLite allows terms in one compound SELECT
+    active = {f"agent_{i:03d}": f"agent_{i:03d}__v{VERSION}" for i in range(510)}
+    results = storage.write_tables({physical: _rates("SHANGHAI", "MSC" if i % 2 else "ONE")
+                                    for i, physical in enumerate(active.values())})
+    assert all(result["ok"] for result in results.values())
+
+    target = storage.build_consolidated_table(active, VERSION)
+    rows = storage.read_table(target, ["POL", "Carrier", "source_table"], (("Carrier", ("MSC",)),))
+    assert len(rows) == 255
+    assert set(rows["POL"]) == {"SHANGHAI"}
+    assert rows["source_table"].iloc[0] == "agent_001"
+    assert len(storage.read_table(target, ["POL"], distinct=True)) == 1
+
+
+def test_promote_and_date_filter(tmp_path):
+    storage = SQLiteStorage(tmp_path / "rates.sqlite")
+    assert storage.read_table_versions() is None
+    storage.write_tables({f"a__v{VERSION}": _rates("NINGBO", "ONE")})
+    target = storage.build_consolidated_table({"a": f"a__v{VERSION}"}, VERSION)
+    storage.promote_table_versions({"a": f"a__v{VERSION}", "rates_all": target}, ["old"], VERSION)
+
+    versions = storage.read_table_versions()
+    assert versions["active"] == {"a": f"a__v{VERSION}", "rates_all": target}
+    assert versions["retired"] == {"old": VERSION}
+    rows = storage.read_table(target, None, (("Expiring_Date", (datetime.date(2025, 7, 31),)),))
+    assert rows["POL"].tolist() == ["NINGBO"]
+
+
+def test_not_before_keeps_current_and_undated_rows(tmp_path):
+    storage = SQLiteStorage(tmp_path / "rates.sqlite")
+    df = pd.DataFrame({"POL": ["A", "B", "C"], "Expiring_Date": [datetime.date(2025, 6, 30), datetime.date(2025, 7, 31), None]})
+    storage.write_tables({"t": df}, rate_schema=False)
+    rows = storage.read_table("t", ["POL"], not_before=(("Expiring_Date", datetime.date(2025, 7, 1)),))
+    assert rows["POL"].tolist() == ["B", "C"]
+
+
+def test_retired_tables_kept_through_the_grace_period(tmp_path):
+    now = datetime.datetime(2025, 1, 1, 0, 20, tzinfo=datetime.timezone.utc)
+    old = (now - datetime.timedelta(seconds=RETIRED_GRACE_SECONDS + 1)).strftime("%Y%m%dT%H%M%S")
+    recent = (now - datetime.timedelta(seconds=60)).strftime("%Y%m%dT%H%M%S")
+    drop, keep = split_retired({"a__vold": old, "b__vrecent": recent}, now)
+    assert drop == ["a__vold"] and keep == {"b__vrecent": recent}
+
+    # still-pending tables keep their own retirement version through the next promote
+    storage = SQLiteStorage(tmp_path / "rates.sqlite")
+    storage.promote_table_versions({"b": "b__vnew"}, {"b__vrecent": recent, "b__vprev": VERSION}, VERSION)
+    assert storage.read_table_versions()["retired"] == {"b__vrecent": recent, "b__vprev": VERSION}
+
+
+def test_read_table_pushes_projection_filters_and_distinct(tmp_path):
+    storage = SQLiteStorage(tmp_path / "rates.sqlite")
+    df = pd.DataFrame({"POL": ["SHANGHAI", "SHANGHAI", "NINGBO", "QINGDAO"], "Carrier": ["MSC", "MSC", "ONE", "MSC"],
+                       "GP20": [1000.0, 1000.0, 900.0, 800.0]})
+    storage.write_tables({"t": df}, rate_schema=False)
+
+    rows = storage.read_table("t", ["POL", "GP40", "GP20"], (("Carrier", ("MSC",)), ("GP20", (1000, 800))))
+    assert rows.columns.tolist() == ["POL", "GP20"]  # columns the table lacks are skipped
+    assert rows["POL"].tolist() == ["SHANGHAI", "SHANGHAI", "QINGDAO"]
+    assert storage.read_table("t", ["POL"], (("Carrier", ("MSC",)),), distinct=True)["POL"].tolist() == ["SHANGHAI", "QINGDAO"]
+    assert storage.read_table("t", None, (("Carrier", ()),)).empty
+
+    with pytest.raises(ValueError):
+        storage.read_table("t", None, (("Remark", ("x",)),))
+    with pytest.raises(ValueError):
+        storage.read_table('t" OR 1=1 --', None)
+
+
+class _FakeBigQuery:
+    def __init__(self, columns):
+        self.columns = columns
+        self.queries = []
+
+    def get_table(self, ref):
+        return SimpleNamespace(schema=[SimpleNamespace(name=col) for col in self.columns])
+
+    def query(self, query, job_config=None):
+        self.queries.append((query, job_config.query_parameters))
+        return SimpleNamespace(to_dataframe=pd.DataFrame)
+
+
+def test_bigquery_read_table_sends_values_as_parameters():
+    client = _FakeBigQuery(["POL", "Carrier", "GP20", "Expiring_Date"])
+    storage = BigQueryStorage(client, "my-project.rates")
+    storage.read_table("rates_all", ["POL", "GP40"],
+                       (("Carrier", ("MSC", "O'NE")), ("Expiring_Date", (datetime.date(2025, 7, 31),))),
+                       distinct=True, not_before=(("Expiring_Date", datetime.date(2025, 7, 1)),))
+
+    (query, params), = client.queries
+    assert query == ("SELECT DISTINCT `POL` FROM `my-project.rates.rates_all` WHERE `Carrier` IN UNNEST(@p0)"
+                     " AND DATE(`Expiring_Date`) IN UNNEST(@p1) AND (`Expiring_Date` >= @d0 OR `Expiring_Date` IS NULL)")
+    assert "O'NE" not in query
+    assert [(p.name, p.array_type, p.values) for p in params[:2]] == [
+        ("p0", "STRING", ["MSC", "O'NE"]), ("p1", "DATE", [datetime.date(2025, 7, 31)])]
+    assert (params[2].name, params[2].type_, params[2].value) == ("d0", "DATE", datetime.date(2025, 7, 1))
+
+
+def test_bigquery_names_checked_before_they_reach_sql():
+    client = _FakeBigQuery(["POL"])
+    for dataset_ref in ("my-project", "My Project.rates", "my-project.rates; DROP"):
+        with pytest.raises(ValueError):
+            BigQueryStorage(client, dataset_ref)
+    storage = BigQueryStorage(client, "my-project.rates")
+    with pytest.raises(ValueError):
+        storage.read_table("rates_all`; DROP TABLE x; --")
+    with pytest.raises(ValueError):
+        storage.read_table("rates_all", None, (("Carrier", ("MSC",)),))
+    assert client.queries == []
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ratesheet_cleaning import parse_rate_column, coerce_rate_columns
+
+
+@pytest.mark.parametrize("raw, amount", [
+    (1250, 1250.0), ("1,250", 1250.0), ("USD 1,250.00", 1250.0), ("$1250", 1250.0),
+    ("1 250", 1250.0), ("US$ 980", 980.0), (" 1250 USD ", 1250.0),
+])
+def test_plain_amounts(raw, amount):
+    values, reasons, _ = parse_rate_column(pd.Series([raw], dtype=object))
+    assert values.tolist() == [amount]
+    assert reasons.isna().all()
+
+
+@pytest.mark.parametrize("raw, leading", [
+    ("1.250,00", 1.25),      # European thousands / decimal separators
+    ("1.250.000", 1.25),
+    ("0.5k", 0.5),
+    ("1250+BAF", 1250.0),
+    ("1250 ALL IN", 1250.0),
+])
+def test_suffixed_and_european_values_are_quarantined(raw, leading):
+    values, reasons, leading_amounts = parse_rate_column(pd.Series([raw], dtype=object))
+    assert np.isnan(values[0])
+    assert reasons[0].startswith("text after amount")
+    assert leading_amounts[0] == leading
+
+
+@pytest.mark.parametrize("raw", [True, False, np.bool_(True)])
+def test_booleans_are_not_amounts(raw):
+    values, reasons, _ = parse_rate_column(pd.Series([raw, 900], dtype=object))
+    assert np.isnan(values[0]) and values[1] == 900.0
+    assert reasons[0] == "not a number: boolean"
+
+
+def test_booleans_told_apart_from_ones_and_zeros():
+    values, reasons, _ = parse_rate_column(pd.Series([1, 0, True, "1", 1.0, False], dtype=object))
+    assert values.tolist()[:2] == [1.0, 0.0] and values.tolist()[3:5] == [1.0, 1.0]
+    assert values[[2, 5]].isna().all()
+    assert reasons.notna().tolist() == [False, False, True, False, False, True]
+
+
+@pytest.mark.parametrize("col", [pd.Series([True, False]), pd.Series([True, False], dtype="boolean")])
+def test_boolean_columns(col):
+    values, reasons, _ = parse_rate_column(col)
+    assert values.isna().all()
+    assert reasons.tolist() == ["not a number: boolean"] * 2
+
+
+def test_markers_and_text():
+    values, reasons, _ = parse_rate_column(pd.Series(["NIL", "-", None, "AT COST"], dtype=object))
+    assert values.isna().all()
+    assert reasons[:3].isna().all() and reasons[3] == "no amount"
+
+
+def test_quarantined_cells_never_rank_as_cheapest():
+    df = pd.DataFrame({"GP20": ["1.250,00", "USD 1,100", "0.5k"], "GP40": [2000, "1250+BAF", True]})
+    df, quarantine = coerce_rate_columns(df, "/x/agent_2025.xlsx")
+    assert df["GP20"].tolist()[1] == 1100.0 and df["GP20"].isna().tolist() == [True, False, True]
+    assert df["GP40"].tolist()[0] == 2000.0 and df["GP40"].isna().tolist() == [False, True, True]
+    assert quarantine[["row", "column"]].values.tolist() == [[0, "GP20"], [2, "GP20"], [1, "GP40"], [2, "GP40"]]
+    assert quarantine["parsed_value"].tolist()[:3] == [1.25, 0.5, 1250.0]
+    assert set(quarantine["source_file"]) == {"agent_2025.xlsx"}
@@ -0,0 +1,147 @@
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.route_index_memory import object_route_index, synthetic_tables
+from route_engine import (build_route_index, explain_unmatched, match_routes, rank_rates, route_value_sets, select_rates,
+                          stale_picks, EXCLUDED)
+
+
+def test_all_null_text_column():
+    tables = {
+        "a": pd.DataFrame({"POL": ["A"], "Destination": ["B"], "Carrier": ["C"], "remark": [None]}),
+        "b": pd.DataFrame({"POL": ["a "], "Destination": ["B"], "Carrier": ["D"], "remark": ["FAK"],
+                           "COMM_DETAILS": [None]}),
+    }
+    index = build_route_index(tables)
+    assert index["remark"].isna().tolist() == [True, False]
+    assert index["COMM_DETAILS"].isna().all()
+
+    matched, unmatched = match_routes(index, [("A", "B", "C"), ("A", "B", "D"), ("A", "B", "E")])
+    assert matched["Source table"].tolist() == ["a", "b"]
+    assert unmatched == [("A", "B", "E")]
+
+
+def test_only_table_all_null():
+    index = build_route_index({"a": pd.DataFrame({"POL": ["A"], "Destination": ["B"], "Carrier": ["C"], "remark": [None]})})
+    assert len(index) == 1 and index["remark"].isna().all()
+
+
+def _rates():
+    return {
+        "a": pd.DataFrame({"POL": ["A", "A", "A", "X"], "Destination": ["B"] * 4, "Carrier": ["C"] * 4,
+                           "GP20": [1000.0, 1100.0, 1200.0, 900.0], "remark": ["r1", "r2", "r3", None]}),
+        "b": pd.DataFrame({"POL": ["A"], "Destination": ["B"], "Carrier": ["D"], "GP20": [950.0]}),
+    }
+
+
+def test_row_keys_stable_across_indexes():
+    full = build_route_index(_rates())
+    sliced = build_route_index({"a": _rates()["a"].iloc[1:3]})
+    assert full["Row key"].is_unique
+    assert sliced["Row key"].tolist() == full["Row key"].iloc[1:3].tolist()
+    assert sliced["Row id"].tolist() != full["Row id"].iloc[1:3].tolist()
+
+
+def test_picks_follow_the_row_not_the_position():
+    full = rank_rates(build_route_index(_rates()))
+    chosen = full.loc[full["GP20"] == 1200.0, "Row key"].iloc[0]
+    picks = {("A", "B", "C"): chosen, ("A", "B", "D"): EXCLUDED}
+
+    # the same pick against an index built over a different selection
+    sliced = rank_rates(build_route_index({"a": _rates()["a"].iloc[[3, 2, 1, 0]]}))
+    selected = select_rates(sliced, picks=picks)
+    assert selected[selected["POL"] == "A"]["GP20"].tolist() == [1200.0]
+    assert "D" not in set(select_rates(full, picks=picks)["Carrier"])
+    assert stale_picks(sliced, picks) == []
+
+
+def test_stale_picks_fall_back_to_cheapest():
+    ranked = rank_rates(build_route_index(_rates()))
+    picks = {("A", "B", "C"): 12345, ("Q", "B", "C"): 678}
+    assert stale_picks(ranked, picks) == [("A", "B", "C")]
+    assert select_rates(ranked, picks=picks)["GP20"].tolist() == [950.0, 1000.0, 900.0]  # by route, then price
+
+
+def test_index_footprint_and_build_peak():
+    tables = synthetic_tables(100_000, 10)
+    held_as_objects = object_route_index(tables).memory_usage(deep=True).sum()
+
+    tracemalloc.start()
+    index = build_route_index(tables)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    held = index.memory_usage(deep=True).sum()
+    assert held * 3 < held_as_objects
+    # codes go straight into the index columns, no per-table frames or key frame on top
+    assert peak < 2 * held
+
+
+def test_missing_text_column_keys_like_an_empty_one():
+    alone = build_route_index({"a": pd.DataFrame({"POL": ["A"], "Destination": ["B"], "Carrier": ["C"]})})
+    with_other = build_route_index({"a": pd.DataFrame({"POL": ["A"], "Destination": ["B"], "Carrier": ["C"]}),
+                                    "b": pd.DataFrame({"POL": ["X"], "Destination": ["B"], "Carrier": ["C"], "remark": ["FAK"]})})
+    assert with_other["remark"].isna().tolist() == [True, False]
+    assert alone["Row key"].iloc[0] == with_other["Row key"].iloc[0]
+
+
+def test_unmatched_reasons_from_value_sets():
+    index = build_route_index({
+        "a": pd.DataFrame({"POL": ["SHANGHAI"], "Destination": ["LAX/LGB"], "Carrier": ["MSC"]}),
+        "b": pd.DataFrame({"POL": ["NINGBO"], "Destination": ["CHICAGO, IL"], "Carrier": ["ONE"]}),
+    })
+    value_sets = route_value_sets(index)
+    assert value_sets == {"a": {"POL": {"SHANGHAI"}, "Destination": {"LAX/LGB"}, "Carrier": {"MSC"}},
+                          "b": {"POL": {"NINGBO"}, "Destination": {"CHICAGO, IL"}, "Carrier": {"ONE"}}}
+
+    routes = [("SHANGHAI", "CHICAGO, IL", "MSC"), ("XIAMEN", "LAX/LGB", "MSC")]
+    _, unmatched = match_routes(index, routes)
+    reasons = explain_unmatched(value_sets, unmatched).set_index("POL")["Reason"]
+    # every value is in some table, just never together
+    assert reasons["SHANGHAI"] == "Cannot find Carrier: MSC，Cannot find Destination: CHICAGO, IL，Cannot find POL: SHANGHAI"
+    assert reasons["XIAMEN"] == "Cannot find Carrier: MSC，Cannot find Destination: LAX/LGB，Cannot find POL: XIAMEN"
+
+    single = route_value_sets(build_route_index({"a": pd.DataFrame({"POL": ["SHANGHAI", "NINGBO"], "Destination": ["LAX/LGB", "CHICAGO, IL"],
+                                                                     "Carrier": ["MSC", "ONE"]})}))
+    reasons = explain_unmatched(single, [("SHANGHAI", "CHICAGO, IL", "ONE"), ("SHANGHAI", "TORONTO", "ONE")])["Reason"]
+    assert reasons.tolist() == ["No table has this POL, Destination and Carrier together", "Cannot find Destination: TORONTO"]
+    assert explain_unmatched(single, []).columns.tolist() == ["POL", "Destination", "Carrier", "Reason"]
+
+
+def _quotes():
+    return pd.DataFrame({
+        "POL": ["A"] * 6 + ["X"], "Destination": ["B"] * 7,
+        "Carrier": ["C", "C", "D", "E", "F", "G", "C"],
+        "GP20": [1100.0, 1000.0, None, 1050.0, 900.0, 1200.0, 700.0],
+        "GP40": [2000.0, 2100.0, 1500.0, 1900.0, 2200.0, None, 1400.0],
+    })
+
+
+def test_rank_rates_per_carrier_with_missing_prices_last():
+    ranked = rank_rates(_quotes())
+    assert ranked["Carrier"].tolist() == ["F", "C", "E", "C", "G", "D", "C"]
+    assert ranked["Carrier rank"].tolist() == [1, 1, 1, 2, 1, 1, 1]
+
+    by_gp40 = rank_rates(_quotes(), "GP40")
+    assert by_gp40["Carrier"].tolist() == ["D", "E", "C", "C", "F", "G", "C"]
+    assert by_gp40["Carrier rank"].tolist() == [1, 1, 1, 2, 1, 1, 1]
+    # all-in totals of the priced quotes, C's second row is cheaper once its fees are in
+    priced = _quotes().assign(**{"20' - ALL IN": [1150.0, 1300.0, None, 1100.0, 1250.0, 1250.0, 750.0]})
+    by_all_in = rank_rates(priced, "20' - ALL IN")
+    assert by_all_in["Carrier"].tolist() == ["E", "C", "F", "G", "C", "D", "C"]
+    assert by_all_in.loc[by_all_in["Carrier rank"] == 1, "GP20"].tolist()[:2] == [1050.0, 1100.0]
+    # a sort column the quotes lack keeps the route order and still ranks
+    assert rank_rates(_quotes(), "40' or HC - ALL IN")["Carrier rank"].tolist() == [1, 2, 1, 1, 1, 1, 1]
+
+
+def test_select_rates_top_n_cheapest_carriers_per_route():
+    ranked = rank_rates(_quotes())
+    selected = select_rates(ranked, top_n=3)
+    assert list(zip(selected["POL"], selected["Carrier"], selected["GP20"])) == [
+        ("A", "F", 900.0), ("A", "C", 1000.0), ("A", "E", 1050.0), ("X", "C", 700.0)]
+    assert select_rates(ranked, top_n=10)["Carrier"].tolist() == ["F", "C", "E", "G", "D", "C"]
+
+    # the cheapest row of each carrier is picked by the ranking key, then ordered by the sort key
+    by_gp40 = select_rates(rank_rates(_quotes(), "GP40"), "GP40", top_n=2)
+    assert list(zip(by_gp40["Carrier"], by_gp40["GP40"])) == [("D", 1500.0), ("E", 1900.0), ("C", 1400.0)]
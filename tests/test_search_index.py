@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from search_index import SearchIndex, parse_query
+
+
+def _rates():
+    return pd.DataFrame({
+        "remark": ["Subject to GRI", "SUBJECT TO GRI", "FAK rates", None, "Valid until 7/31, PSS included"],
+        "COMM": ["FAK", "FAK", None, "Garments", "FAK"],
+        "COMM_DETAILS": [None, "no hazardous", None, "HS 6109", None],
+    })
+
+
+def test_parse_query_terms():
+    assert parse_query('GRI, "subject to";/PSS\\s+inc/ FAK') == [
+        ("keyword", "gri"), ("phrase", "subject to"), ("regex", "PSS\\s+inc"), ("keyword", "fak")]
+    assert parse_query("") == parse_query(None) == parse_query('" "') == []
+
+
+def test_keywords_match_inside_tokens_across_columns():
+    index = SearchIndex(_rates())
+    assert index.mask("gri").tolist() == [True, True, False, False, False]
+    assert index.mask("garm").tolist() == [False, False, False, True, False]
+    assert index.mask("hazard 6109").tolist() == [False, True, False, True, False]
+    assert index.mask("fak gri", how="all").tolist() == [True, True, False, False, False]
+    assert not index.mask("").any()
+
+
+def test_phrases_and_regex():
+    index = SearchIndex(_rates())
+    assert index.mask('"to gri"').tolist() == [True, True, False, False, False]
+    assert not index.mask('"gri to"').any()
+    assert index.mask("7/31,").tolist() == [False, False, False, False, True]
+    assert index.mask(r"/hs\s*\d{4}/").tolist() == [False, False, False, True, False]
+    assert index.mask(r"/^fak/").tolist() == [False, False, True, False, False]
+    with pytest.raises(ValueError, match="invalid regex"):
+        index.mask("/(unclosed/")
+
+
+def test_missing_columns_are_skipped():
+    index = SearchIndex(pd.DataFrame({"POL": ["SHANGHAI", "NINGBO"], "COMM": ["FAK", None]}))
+    assert index.mask("fak").tolist() == [True, False]
+    assert not SearchIndex(pd.DataFrame({"POL": ["SHANGHAI"]})).mask("shanghai").any()
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+
+from table_cache import TableCache
+
+
+def _frame(rows):
+    return pd.DataFrame({"POL": [f"PORT {i}" for i in range(rows)], "GP20": [float(i) for i in range(rows)]})
+
+
+def _files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names if name.endswith(".parquet"))
+
+
+def test_results_held_under_max_bytes_least_recently_used_first(tmp_path):
+    probe = TableCache(tmp_path / "probe")
+    probe.write("rates", "v1", {"q": 0}, _frame(200))
+    size = os.path.getsize(os.path.join(tmp_path / "probe", "rates", _files(tmp_path / "probe")[0]))
+
+    cache = TableCache(tmp_path / "cache", max_bytes=int(size * 2.5))
+    for i in range(3):
+        cache.write("rates", "v1", {"q": i}, _frame(200))
+        path = cache._path("rates", "v1", {"q": i})
+        os.utime(path, (1000 + i, 1000 + i))
+    # the oldest write went to make room for the third
+    assert cache.read("rates", "v1", {"q": 0}) is None
+    assert len(_files(tmp_path / "cache")) == 2
+
+    # a read keeps a result: q1 is used, so q2 goes when q3 (another table) arrives
+    assert cache.read("rates", "v1", {"q": 1}) is not None
+    cache.write("other", "v7", {"q": 3}, _frame(200))
+    assert cache.read("rates", "v1", {"q": 2}) is None
+    assert cache.read("rates", "v1", {"q": 1}) is not None
+    assert cache.read("other", "v7", {"q": 3}) is not None
+
+
+def test_new_version_misses_and_prunes_the_old_results(tmp_path):
+    cache = TableCache(tmp_path)
+    cache.write("rates", "v1", {"columns": ["POL"]}, _frame(3))
+    cache.write("rates", "v1", {"columns": ["GP20"]}, _frame(3))
+    cache.write_columns("rates", "v1", ["POL", "GP20"])
+    cache.write("other", "v1", {"columns": ["POL"]}, _frame(1))
+    pd.testing.assert_frame_equal(cache.read("rates", "v1", {"columns": ["POL"]}), _frame(3))
+    assert cache.read("rates", "v1", {"columns": ["Carrier"]}) is None
+    assert cache.read_columns("rates", "v1") == ["POL", "GP20"]
+
+    assert cache.read("rates", "v2", {"columns": ["POL"]}) is None
+    cache.write("rates", "v2", {"columns": ["POL"]}, _frame(2))
+    assert len(os.listdir(tmp_path / "rates")) == 1
+    assert cache.read("rates", "v1", {"columns": ["GP20"]}) is None and cache.read_columns("rates", "v1") is None
+    assert len(cache.read("rates", "v2", {"columns": ["POL"]})) == 2
+    assert cache.read("other", "v1", {"columns": ["POL"]}) is not None  # other tables are left alone
+
+
+def test_unreadable_results_are_misses_and_unwritable_frames_skipped(tmp_path, capsys):
+    cache = TableCache(tmp_path)
+    cache.write("rates", "v1", "q", _frame(3))
+    with open(cache._path("rates", "v1", "q"), "wb") as f:
+        f.write(b"PAR1 truncated")
+    assert cache.read("rates", "v1", "q") is None
+
+    cache.write("rates", "v1", "mixed", pd.DataFrame({"remark": ["FAK", 45]}))
+    assert "Not caching rates" in capsys.readouterr().out
+    assert cache.read("rates", "v1", "mixed") is None
+    assert not [name for name in os.listdir(tmp_path / "rates") if name.endswith(".tmp")]
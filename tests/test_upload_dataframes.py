@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from bigquery_utils import upload_dataframes
+
+JOB_CONFIG = object()
+
+
+class FakeJob:
+    def __init__(self, client, error=None, polls=0):
+        self.client, self.error, self.polls = client, error, polls
+
+    def done(self):
+        self.polls -= 1
+        return self.polls < 0
+
+    def result(self):
+        self.client.finished()
+        if self.error is not None:
+            raise self.error
+
+
+class FakeClient:
+    """ Plays back one scripted outcome per load attempt: None loads, ("submit", exc) fails
+        load_table_from_dataframe itself, ("job", exc) fails the returned job """
+
+    def __init__(self, script, polls=0):
+        self.script = {table_id: list(outcomes) for table_id, outcomes in script.items()}
+        self.polls = polls
+        self.calls = {table_id: [] for table_id in script}
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def load_table_from_dataframe(self, df, table_id, job_config=None):
+        assert isinstance(df, pd.DataFrame)
+        assert job_config is JOB_CONFIG
+        self.calls[table_id].append(time.monotonic())
+        outcome = self.script[table_id].pop(0) if self.script[table_id] else None
+        if outcome is not None and outcome[0] == "submit":
+            raise outcome[1]
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return FakeJob(self, None if outcome is None else outcome[1], self.polls)
+
+    def finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def _upload(client, tables, **kwargs):
+    kwargs.setdefault("backoff", 0.05)
+    kwargs.setdefault("poll_interval", 0.001)
+    frames = {table_id: pd.DataFrame({"GP20": [1000.0]}) for table_id in tables}
+    return upload_dataframes(client, frames, job_config=JOB_CONFIG, **kwargs)
+
+
+def test_transient_failures_retried_with_exponential_backoff(capsys):
+    client = FakeClient({"t": [("submit", api_exceptions.ServiceUnavailable("busy")),
+                               ("job", api_exceptions.InternalServerError("oops")), None]})
+    results = _upload(client, ["t"])
+
+    assert results["t"]["ok"] and results["t"]["attempts"] == 3 and results["t"]["error"] is None
+    first, second, third = client.calls["t"]
+    assert second - first >= 0.05
+    assert third - second >= 0.1
+    out = capsys.readouterr().out
+    assert "retrying in 0.1s" in out and "ServiceUnavailable" in out and "InternalServerError" in out
+
+
+def test_gives_up_after_retries():
+    client = FakeClient({"t": [("job", TimeoutError("slow"))] * 5})
+    results = _upload(client, ["t"], retries=2, backoff=0.001)
+
+    assert not results["t"]["ok"]
+    assert results["t"]["attempts"] == 3
+    assert results["t"]["error"] == "TimeoutError: slow"
+    assert len(client.calls["t"]) == 3
+
+
+@pytest.mark.parametrize("error, attempts", [
+    (api_exceptions.BadRequest("bad schema"), 1),
+    (api_exceptions.Forbidden("denied", errors=[{"reason": "accessDenied"}]), 1),
+    (api_exceptions.Forbidden("slow down", errors=[{"reason": "rateLimitExceeded"}]), 2),
+])
+def test_only_transient_errors_are_retried(error, attempts):
+    client = FakeClient({"t": [("job", error)]})
+    results = _upload(client, ["t"], backoff=0.001)
+
+    assert results["t"]["attempts"] == attempts
+    assert results["t"]["ok"] == (attempts > 1)
+
+
+def test_in_flight_jobs_capped_and_results_in_frame_order():
+    tables = [f"t{i}" for i in reversed(range(10))]
+    client = FakeClient({table_id: [] for table_id in tables}, polls=3)
+    results = _upload(client, tables, max_workers=3)
+
+    assert list(results) == tables
+    assert all(result["ok"] and result["attempts"] == 1 for result in results.values())
+    assert client.max_in_flight == 3
+
+
+def test_callable_frames_built_per_attempt():
+    built = []
+
+    def frame():
+        built.append(1)
+        return pd.DataFrame({"GP20": [1000.0]})
+
+    client = FakeClient({"t": [("submit", ConnectionError("reset"))]})
+    results = upload_dataframes(client, {"t": frame}, backoff=0.001, poll_interval=0.001, job_config=JOB_CONFIG)
+
+    assert results["t"]["ok"]
+    assert len(built) == 2